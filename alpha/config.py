@@ -15,19 +15,79 @@ DIM = (2 * STEP + 1, SIZE[0], SIZE[1])
 KERNELS = (3, 3)
 FILTERS = 32
 
+# params for the NumPy inference engine, see export.py
+ENGINE = 0      # play with the exported network instead of Keras
+ENGINE_PATH = 'alpha/data/pvmodel.npz'   # or a smaller copy from quantize.py
+
 # train params for policy value network during self-play
 
 INIT = 0
-AUGMENT = 1
+AUGMENT = 1     # 0: none, 1: store all 8 symmetries, 2: random at sampling
 TRAIN_EPOCHS = 50
 BATCH = 64
 SELF_PLAY_EPOCHS = 1000
 
+# params for the streaming trainer, training runs while self-play goes on
+STREAMING = 0
+TRAIN_STEPS = 100000
+PREFETCH = 4            # minibatches sampled ahead of the training step
+MIN_POSITIONS = 2000    # samples in the buffer before training starts
+TRAIN_RATIO = 0         # max training steps per generated position, 0 any
+REPORT_STEPS = 100
+PUBLISH_STEPS = 500     # steps between weights given to self-play
+SAVE_STEPS = 2000
+
+# params for the compact self-play game records, ARCHIVE trains on them
+RECORD = 0
+RECORD_PATH = 'alpha/data/games/selfplay'
+RECORD_CHUNK = 1000     # games per record file
+
+# params for the memory-mapped dataset of archived positions
+ARCHIVE = 0             # train on the archived games instead of self-play
+ARCHIVE_EPOCHS = 10
+DATASET_PATH = 'alpha/data/dataset'
+DATASET_BLOCK = 1024    # contiguous positions read at once
+DATASET_MIX = 16        # blocks shuffled together
+
+# params for the replay buffer
+REPLAY_CAPACITY = 50000
+REPLAY_SAMPLE = 512
+REPLAY_PATH = 'alpha/data/replay'
+
+# params for parallel self-play, 0 workers plays in the trainer process
+SELF_PLAY_WORKERS = 0
+WEIGHT_REFRESH = 5
+POOL_GAMES = 0      # games played at once in the trainer process, 0 one
+
+# params for the inference server shared by self-play workers
+INFERENCE_SERVER = 0
+SERVER_BATCH = 32
+SERVER_WAIT = 0.002
+
 # params for MCTS
 c_puct = 5
 N_SIMULATE = 500
+COPY_FREE = 1
+BATCH_MCTS = 8
+VIRTUAL_LOSS = 3
+ARRAY_TREE = 1
+TREE_NODES = 100000  # nodes of the array tree and cap of the pondering tree
+TIME_BUDGET = 0     # ms per move in play mode, 0 runs N_SIMULATE
+EARLY_STOP = 1
+TT_SIZE = 0     # positions in the transposition table, 0 disables it
+EVAL_CACHE_MB = 64  # memory budget of the network output cache, 0 disables it
+EVAL_CACHE_SYMMETRY = 1
+CANDIDATE_DIST = 0  # search positions within this distance of a piece, 0 all
+
+
+# params for profiling, also enabled with the ALPHA_PROFILE env var
+PROFILE = 0
+PROFILE_PATH = 'alpha/data/profile'
 
 
 # param for game AI
 FIRST = 0
 AI_V_AI = 1
+PONDER = 1
+PONDER_LIMIT = 20000    # simulations searched on the opponent's time,
+                        # the tree also stops at TREE_NODES
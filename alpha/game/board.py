@@ -3,20 +3,144 @@
 A checkerboard of the Gomoku game.
 """
 from .. import config as c
+from .. import profiler
 import numpy as np
 
 
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+_WINDOWS = {}
+_LINES = {}
+_NEIGHBOURS = {}
+_ZOBRIST = {}
+
+
+def _zobrist_keys(size):
+    """Get the Zobrist keys of every (player, position).
+
+    The hash of a position is the XOR of the keys of its pieces. The side to
+    move follows from the number of pieces, so it needs no key.
+
+    # Arguments
+        size: tuple, height and width of checkerboard.
+
+    # Returns
+        keys: List, 64-bit integer key per position for player 1 and 2.
+    """
+    key = (size[0], size[1])
+    if key not in _ZOBRIST:
+        rng = np.random.RandomState(2018)
+        n = size[0] * size[1]
+        _ZOBRIST[key] = [None] + [
+            [int(k) for k in rng.randint(0, 2 ** 63, n, dtype=np.int64)]
+            for _ in range(2)]
+
+    return _ZOBRIST[key]
+
+
+def _win_windows(size, piece):
+    """Get the winning line masks through every position.
+
+    Every mask is a packed integer with `piece` consecutive bits set along
+    one direction; a player wins when its bitboard covers one of the masks
+    passing through the last move. The table only depends on the board
+    geometry, so it is built once and shared by all boards.
+
+    # Arguments
+        size: tuple, height and width of checkerboard.
+        piece: Integer, number of piece to win.
+
+    # Returns
+        windows: List, tuple of masks for each position.
+    """
+    key = (size[0], size[1], piece)
+    if key not in _WINDOWS:
+        windows = [[] for _ in range(size[0] * size[1])]
+
+        for cells in _win_lines(size, piece)[0].tolist():
+            mask = 0
+            for s in cells:
+                mask |= 1 << s
+            for s in cells:
+                windows[s].append(mask)
+
+        _WINDOWS[key] = [tuple(w) for w in windows]
+
+    return _WINDOWS[key]
+
+
+def _win_lines(size, piece):
+    """Get the cells of every winning line and the lines through every
+    position, as index arrays for the line counts of the candidate moves.
+
+    # Arguments
+        size: tuple, height and width of checkerboard.
+        piece: Integer, number of piece to win.
+
+    # Returns
+        cells: ndarray(lines, piece), positions of every line.
+        lines: List, ndarray of the lines through each position.
+    """
+    key = (size[0], size[1], piece)
+    if key not in _LINES:
+        height, width = size
+        cells = []
+
+        for dr, dc in DIRECTIONS:
+            for row in range(height):
+                for col in range(width):
+                    end_row = row + dr * (piece - 1)
+                    end_col = col + dc * (piece - 1)
+                    if 0 <= end_row < height and 0 <= end_col < width:
+                        cells.append([(row + dr * i) * width + col + dc * i
+                                      for i in range(piece)])
+
+        cells = np.array(cells, dtype=np.int32).reshape(-1, piece)
+        lines = [np.flatnonzero((cells == s).any(axis=1))
+                 for s in range(height * width)]
+        _LINES[key] = (cells, lines)
+
+    return _LINES[key]
+
+
+def _neighbours(size, distance):
+    """Get the positions within a distance of every position.
+
+    # Arguments
+        size: tuple, height and width of checkerboard.
+        distance: Integer, max number of rows and columns apart.
+
+    # Returns
+        neighbours: List, ndarray of the neighbours of each position,
+            the position itself excluded.
+    """
+    key = (size[0], size[1], distance)
+    if key not in _NEIGHBOURS:
+        height, width = size
+        rows, cols = np.divmod(np.arange(height * width), width)
+        _NEIGHBOURS[key] = [
+            np.flatnonzero((np.abs(rows - row) <= distance) &
+                           (np.abs(cols - col) <= distance) &
+                           ((rows != row) | (cols != col)))
+            for row, col in zip(rows, cols)]
+
+    return _NEIGHBOURS[key]
+
+
 class Board(object):
     """
     CheckerBoard
     """
 
-    def __init__(self, size, piece, start_player):
+    def __init__(self, size, piece, start_player,
+                 distance=c.CANDIDATE_DIST):
         """
         # Arguments
             size Integer: height and width of checkerboard.
             piece: Integer, number of piece to win.
             start_player: Integer, which player is the first to start.
+            distance: Integer, candidate moves are the positions within
+                this distance of a piece, 0 makes every empty position a
+                candidate.
         """
         self.size = size
         self.piece = piece
@@ -28,7 +152,22 @@ class Board(object):
             raise Exception('Start player must be 1 or 2')
 
         if self.size[0] < self.piece or self.size[1] < self.piece:
-            raise Exception('Board size can not less than %d' % self.nums)
+            raise Exception('Board size can not less than %d' % self.piece)
+
+        self.bitboards = [0, 0, 0]  # packed occupancy of player 1 and 2
+        self.occupied = np.zeros(self.size[0] * self.size[1], dtype=np.uint8)
+        # occupancy plane of player 1 and 2
+        self.planes = np.zeros((3, self.size[0], self.size[1]), dtype=np.uint8)
+        self.winner = 0     # player who won with the last move
+        self.hash = 0       # Zobrist hash of the pieces
+
+        self.distance = distance
+        if distance:
+            # pieces within the distance of every position
+            self.near = np.zeros(len(self.occupied), dtype=np.int16)
+            # pieces of player 1 and 2 on every winning line
+            n_lines = len(_win_lines(self.size, self.piece)[0])
+            self.lines = np.zeros((3, n_lines), dtype=np.int8)
 
     def _convert_position(self, p, t):
         """Convert position of piece.
@@ -52,36 +191,52 @@ class Board(object):
 
             return m
 
-    def get_current_states(self):
+    @profiler.phase('board.get_current_states')
+    def get_current_states(self, out=None):
         """Get current states on the board.
 
+        The occupancy planes of both players are kept up to date by `move`
+        and `unmove`, the history planes are derived from them by taking
+        back the last pieces of each player, so the cost does not depend on
+        the length of the game.
+
+        # Arguments
+            out: ndarray, optional preallocated array (e.g. a slot of a
+                batch) the states are written into.
+
         # Returns
             states_matrix: ndarray(height * width * (period + 1)),
-                states on the board with in period.
+                states on the board with in period, 0/1 uint8 planes
+                unless `out` has another dtype.
         """
-        states_matrix = np.zeros((c.STEP * 2 + 1, self.size[0], self.size[1]))
-
-        cur = [self.states[i] for i in range(len(self.states) - 2, -1, -2)]
-        opp = [self.states[i] for i in range(len(self.states) - 1, -1, -2)]
-        temp = [cur, opp]
-
-        for i in range(2):
-            x = temp[i]
-            p = len(x) if len(x) < c.STEP else c.STEP
+        states_matrix = out
+        if states_matrix is None:
+            states_matrix = np.zeros((c.STEP * 2 + 1, self.size[0], self.size[1]),
+                                     dtype=np.uint8)
+
+        n = len(self.states)
+        # the player who made the last move is the opponent
+        if n:
+            opp = 1 if self.bitboards[1] >> self.states[-1] & 1 else 2
+            cur = 1 if opp == 2 else 2
+        else:
+            cur = self.current_player
+            opp = 1 if cur == 2 else 2
+        width = self.size[1]
 
-            if i == 0:
-                index = list(range(0, c.STEP * 2, 2))
-            else:
-                index = list(range(1, c.STEP * 2, 2))
+        states_matrix[0] = self.planes[cur]
+        states_matrix[1] = self.planes[opp]
 
-            for j in range(p):
-                x_step = x[j:]
-                for t in x_step:
-                    row, col = self._convert_position(t, 'm')
-                    states_matrix[index[j]][row][col] = 1
+        for j in range(1, c.STEP):
+            # remove the j-th most recent piece of each player
+            for i, last in enumerate([n - 2 * j, n - 2 * j + 1]):
+                plane = states_matrix[2 * j + i]
+                plane[:] = states_matrix[2 * j + i - 2]
+                if last >= 0:
+                    row, col = divmod(self.states[last], width)
+                    plane[row, col] = 0
 
-        if self.current_player == self.start_player:
-            states_matrix[c.STEP * 2] = np.ones((self.size[0], self.size[1]))
+        states_matrix[c.STEP * 2] = self.current_player == self.start_player
 
         return states_matrix
 
@@ -115,14 +270,54 @@ class Board(object):
         """
         if isinstance(move, tuple):
             move = self._convert_position(move, 's')
+        move = int(move)
+
+        if not 0 <= move < len(self.occupied) or self.occupied[move]:
+            return 0
+
+        self.states.append(move)
+        self.occupied[move] = 1
+
+        player = self.current_player
+        bits = self.bitboards[player] | (1 << move)
+        self.bitboards[player] = bits
+        self.planes[player][divmod(move, self.size[1])] = 1
+        self.hash ^= _zobrist_keys(self.size)[player][move]
+        if self.distance:
+            self.near[_neighbours(self.size, self.distance)[move]] += 1
+            self.lines[player][_win_lines(self.size, self.piece)[1][move]] += 1
+
+        # only lines through the new piece can be completed by this move
+        for mask in _win_windows(self.size, self.piece)[move]:
+            if bits & mask == mask:
+                self.winner = player
+                break
 
-        if move in self.states:
-            pos = 0
-        else:
-            pos = 1
-            self.states.append(move)
+        return 1
+
+    def unmove(self):
+        """Take back the last move.
+        The piece is removed from the board, the move stack is popped and the
+        win flag is cleared. The current player is left untouched, callers
+        that changed player after `move` must change it back themselves.
+
+        # Returns
+            move: Integer, position of the removed piece.
+        """
+        move = self.states.pop()
+        player = 1 if self.bitboards[1] >> move & 1 else 2
+
+        self.bitboards[player] &= ~(1 << move)
+        self.planes[player][divmod(move, self.size[1])] = 0
+        self.hash ^= _zobrist_keys(self.size)[player][move]
+        self.occupied[move] = 0
+        if self.distance:
+            self.near[_neighbours(self.size, self.distance)[move]] -= 1
+            self.lines[player][_win_lines(self.size, self.piece)[1][move]] -= 1
+        # no move can be played after a win, so the position before was open
+        self.winner = 0
 
-        return pos
+        return move
 
     def change_player(self):
         """Change current player.
@@ -143,79 +338,67 @@ class Board(object):
         # Returns
             availables: ndarray, availables position
         """
-        availables = np.zeros(self.size[0] * self.size[1])
+        return np.flatnonzero(self.occupied == 0)
 
-        for i in range(len(availables)):
-            if i in self.states:
-                availables[i] = 1
+    def _threats(self, player):
+        """Get the positions that complete a line of a player.
 
-        availables = np.argwhere(availables == 0).reshape(1, -1)[0]
+        # Arguments
+            player: Integer, player 1 or 2.
+
+        # Returns
+            threats: ndarray, empty positions winning for the player.
+        """
+        other = 1 if player == 2 else 2
+        lines = np.flatnonzero((self.lines[player] == self.piece - 1) &
+                               (self.lines[other] == 0))
+        if not len(lines):
+            return lines
+        cells = _win_lines(self.size, self.piece)[0][lines].ravel()
 
-        return availables
+        return np.unique(cells[self.occupied[cells] == 0])
 
-    def _win(self, cps):
-        """Check winner.
-        Check if the current player win the Gomoku game.
+    @profiler.phase('board.get_candidates')
+    def get_candidates(self):
+        """Get the moves worth searching.
 
-        # Arguments
-            cps: List, position of piece for one player.
+        A winning move of the current player is played at once and a winning
+        move of the opponent must be blocked, otherwise the candidates are
+        the empty positions near a piece. Both the neighbour counts and the
+        line counts are updated by `move` and `unmove`, so the cost does not
+        depend on the number of pieces.
 
         # Returns
-            win: Integer, game win or not.(1: win, -1: continue)
+            candidates: ndarray, candidate positions, all the available
+                positions if the distance is 0.
         """
-        win = -1
-
-        cur_piece = np.array(self._convert_position(cps[0], 'm'))
-
-        direct = np.array([[[-1, 0], [1, 0]],
-                           [[0, -1], [0, 1]],
-                           [[-1, -1], [1, 1]],
-                           [[1, -1], [-1, 1]]])
-        for d in direct:
-            count = 1
-            for x in d:
-                flag = True
-                temp = cur_piece
-                while flag:
-                    temp = temp + x
-                    s = self._convert_position(temp, 's')
-                    if s in cps and 0 <= temp[0] < self.size[0] and 0 <= temp[1] < self.size[0]:
-                        count += 1
-                    else:
-                        flag = False
-
-            if count >= self.piece:
-                win = 1
-                break
+        if not self.distance:
+            return self.get_availables()
 
-        return win
+        if not self.states:
+            # open around the center
+            center = (self.size[0] // 2) * self.size[1] + self.size[1] // 2
+            neighbours = _neighbours(self.size, self.distance)[center]
+            return np.sort(np.append(neighbours, center))
 
+        player = self.current_player
+        for p in [player, 1 if player == 2 else 2]:
+            threats = self._threats(p)
+            if len(threats):
+                return threats
+
+        return np.flatnonzero((self.near > 0) & (self.occupied == 0))
+
+    @profiler.phase('board.get_game_status')
     def get_game_status(self):
         """Check the game result.
 
         # Returns
             Competition win or not.(0: draw, 1: win, -1: continue), winner
         """
-        if len(self.states) > 8:
-            cur = [self.states[i] for i in range(len(self.states) - 1, -1, -2)]
-            other = [x for x in self.states if x not in cur]
-            other.reverse()
-
-            a = len(self.states) == self.size[0] * self.size[1]
-            win_c = self._win(cur)
-            win_o = self._win(other)
-
-            if win_c == 1 and win_o != 1:
-                return win_c, self.current_player
-            elif win_o == 1 and win_c != 1:
-                winner = 1 if self.current_player == 2 else 2
-                return win_o, winner
-            elif win_c == -1 and win_o == -1 and a:
-                return 0, 0
-            elif win_c == -1 and win_o == -1:
-                return -1, 0
-            else:
-                print("Wrong: {0}, {1}".format(win_c, win_o))
-                return -1, -1
+        if self.winner:
+            return 1, self.winner
+        elif len(self.states) == len(self.occupied):
+            return 0, 0
         else:
             return -1, 0
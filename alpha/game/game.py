@@ -3,6 +3,7 @@
 Game process of Gomoku.
 """
 import numpy as np
+from .. import profiler
 from .board import Board
 
 
@@ -57,11 +58,13 @@ class Game(object):
 
         return win, winner, movements
 
-    def self_play(self, player):
+    @profiler.phase('game.self_play')
+    def self_play(self, player, writer=None):
         """Start the match between player1 and player2.
 
         # Arguments
             player: Player, player built with pv network.
+            writer: RecordWriter, the game record is appended to it.
 
         # Returns
             states: List, Input states for training.
@@ -70,7 +73,7 @@ class Game(object):
         """
         self._restart_game()
         winner, win = 0, 0
-        states, move_probs, cor_players = [], [], []
+        states, move_probs, cor_players, visits = [], [], [], []
 
         while True:
             states.append(self.board.get_current_states())
@@ -82,6 +85,7 @@ class Game(object):
                 return -1
 
             move_probs.append(probs)
+            visits.append(player.mcts.visits)
             current_player = self.board.get_current_player()
             cor_players.append(current_player)
 
@@ -99,4 +103,8 @@ class Game(object):
         else:
             values = np.zeros(len(move_probs))
 
-        return np.array(states), np.array(move_probs), values
+        if writer is not None:
+            writer.write(self.board.states, visits, winner if win == 1 else 0,
+                         self.start_player)
+
+        return np.array(states), np.array(move_probs, dtype=np.float32), values
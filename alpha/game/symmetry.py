@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Dihedral symmetries of the square checkerboard.
+
+Symmetry k in [0, 8) rotates the board k % 4 times counterclockwise and then
+flips it left-right when k >= 4. All functions work on whole batches of
+planes with shape (..., height, width).
+"""
+import numpy as np
+
+
+N_SYMMETRY = 8
+
+
+def transform(planes, k):
+    """Apply one symmetry to a batch of planes.
+
+    # Arguments
+        planes: ndarray, planes with shape (..., height, width).
+        k: Integer, index of the symmetry.
+
+    # Returns
+        ndarray, transformed planes (a view when possible).
+    """
+    planes = np.rot90(planes, k % 4, axes=(-2, -1))
+    if k >= 4:
+        planes = np.flip(planes, axis=-1)
+
+    return planes
+
+
+def transform_policy(probs, k, size):
+    """Apply one symmetry to a batch of flat policies.
+
+    # Arguments
+        probs: ndarray, policies with shape (n, height * width).
+        k: Integer, index of the symmetry.
+        size: tuple, height and width of checkerboard.
+
+    # Returns
+        ndarray, transformed policies with shape (n, height * width).
+    """
+    planes = probs.reshape((len(probs),) + tuple(size))
+
+    return transform(planes, k).reshape(len(probs), -1)
+
+
+def inverse(k):
+    """Get the symmetry that undoes symmetry k.
+    """
+    return (4 - k) % 4 if k < 4 else k
+
+
+def augment(states, probs, values):
+    """Produce all the symmetries of a batch.
+
+    # Arguments
+        states: ndarray, states with shape (n, channels, height, width).
+        probs: ndarray, policies with shape (n, height * width).
+        values: ndarray, values with shape (n,).
+
+    # Returns
+        states, probs, values: ndarray, the 8 symmetries of every sample,
+            symmetry-major.
+    """
+    size = states.shape[-2:]
+
+    states = np.concatenate([transform(states, k) for k in range(N_SYMMETRY)])
+    probs = np.concatenate([transform_policy(probs, k, size)
+                            for k in range(N_SYMMETRY)])
+    values = np.tile(values, N_SYMMETRY)
+
+    return states, probs, values
+
+
+def random_symmetry(states, probs):
+    """Apply an independent random symmetry to every sample in place.
+
+    # Arguments
+        states: ndarray, states with shape (n, channels, height, width).
+        probs: ndarray, policies with shape (n, height * width).
+    """
+    size = states.shape[-2:]
+    ks = np.random.randint(0, N_SYMMETRY, len(states))
+
+    for k in range(1, N_SYMMETRY):
+        index = np.flatnonzero(ks == k)
+        if len(index):
+            states[index] = transform(states[index], k)
+            probs[index] = transform_policy(probs[index], k, size)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo Tree Search on a tree stored as preallocated NumPy arrays.
+
+Every node is an index into flat arrays holding its visit count N, total
+value W, prior P and the position of its children, which are allocated as
+one contiguous block. PUCT selection over all children is therefore a single
+vectorized argmax instead of a Python max over TreeNode objects.
+"""
+import numpy as np
+
+from .policy_mcts import MCTS
+
+
+class ArrayMCTS(MCTS):
+    """
+    MCTS with a struct-of-arrays tree.
+    """
+
+    def __init__(self, policy_value_fn, c_put, n_simulate, copy_free=1,
+                 batch=1, virtual_loss=3, time_budget=0, early_stop=1,
+                 tt_size=0, capacity=100000):
+        """Init.
+
+        # Arguments
+        policy_value_fn: function, policy value network call, see MCTS.
+        c_put: Integer, a number controlling the relative impact of
+            values, v, and prior probability p on this node's score.
+        n_simulate: Integer, simulate times.
+        copy_free: Boolean, simulate on the board itself and take the moves
+            back afterwards instead of simulating on a deep copy.
+        batch: Integer, max number of leaves evaluated in one network call.
+        virtual_loss: Integer, losses added to the path of a pending leaf.
+        time_budget: Integer, wall-clock budget per move in ms, 0 for no
+            limit.
+        early_stop: Boolean, stop once the remaining simulations cannot
+            change the most visited move.
+        tt_size: Integer, number of positions kept in the transposition
+            table, 0 disables it.
+        capacity: Integer, number of preallocated nodes, the arrays grow
+            when a search needs more.
+        """
+        super(ArrayMCTS, self).__init__(policy_value_fn, c_put, n_simulate,
+                                        copy_free, batch, virtual_loss,
+                                        time_budget, early_stop, tt_size)
+        self.tree = self._allocate(capacity)
+        self.spare = self._allocate(capacity)
+        self._reset()
+
+    def _allocate(self, capacity):
+        """Allocate the arrays of a tree.
+
+        # Arguments
+            capacity: Integer, number of nodes.
+
+        # Returns
+            tree: Dict, node arrays.
+        """
+        return {'n': np.zeros(capacity, dtype=np.int32),         # visits
+                'w': np.zeros(capacity, dtype=np.float64),       # total value
+                'p': np.zeros(capacity, dtype=np.float32),       # prior
+                'vl': np.zeros(capacity, dtype=np.int32),        # virtual loss
+                'action': np.zeros(capacity, dtype=np.int32),   # move to node
+                'parent': np.zeros(capacity, dtype=np.int32),
+                'first': np.zeros(capacity, dtype=np.int32),    # first child
+                'count': np.zeros(capacity, dtype=np.int32)}    # children
+
+    def _reset(self):
+        """Clear the tree down to a single unexpanded root.
+        """
+        self._set_tree(self.tree)
+        self.root = 0
+        self.top = 1
+        self._init_nodes(0, 1)
+        self.p[0] = 1.0
+        self.parent[0] = -1
+
+    def _set_tree(self, tree):
+        """Bind the node arrays as attributes for the hot loops.
+
+        # Arguments
+            tree: Dict, node arrays from `_allocate`.
+        """
+        self.tree = tree
+        self.n = tree['n']
+        self.w = tree['w']
+        self.p = tree['p']
+        self.vl = tree['vl']
+        self.action = tree['action']
+        self.parent = tree['parent']
+        self.first = tree['first']
+        self.count = tree['count']
+
+    def _init_nodes(self, start, end):
+        """Reset the statistics of a block of new nodes.
+
+        # Arguments
+            start: Integer, first node of the block.
+            end: Integer, node after the last one of the block.
+        """
+        self.n[start:end] = 0
+        self.w[start:end] = 0
+        self.vl[start:end] = 0
+        self.first[start:end] = -1
+        self.count[start:end] = 0
+
+    def _grow(self, size):
+        """Make room for at least size more nodes.
+        The arrays of both trees double until they fit.
+
+        # Arguments
+            size: Integer, number of nodes about to be allocated.
+        """
+        capacity = len(self.n)
+        if self.top + size <= capacity:
+            return
+
+        capacity = max(2 * capacity, self.top + size)
+        for tree in [self.tree, self.spare]:
+            for key, array in tree.items():
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[:len(array)] = array
+                tree[key] = grown
+        self._set_tree(self.tree)
+
+    def _is_leaf(self, node):
+        """Check if a node has not been expanded yet.
+
+        # Arguments
+            node: Integer, index of the node.
+
+        # Returns
+            Boolean, if the node has no children.
+        """
+        return self.first[node] < 0
+
+    def _is_pending(self, node):
+        """Check if a leaf is waiting for its evaluation.
+
+        # Arguments
+            node: Integer, index of the node.
+
+        # Returns
+            Integer, virtual losses on the node, 0 if none.
+        """
+        return self.vl[node]
+
+    def _select_child(self, node):
+        """Select the child with maximum action value, pending visits
+        counted as losses.
+
+        # Arguments
+            node: Integer, index of an expanded node.
+
+        # Returns
+            tuple, (action, index of the child)
+        """
+        start = self.first[node]
+        end = start + self.count[node]
+
+        n = self.n[start:end] + self.vl[start:end]
+        w = self.w[start:end] - self.vl[start:end]
+        q = w / np.maximum(n, 1)
+        u = self.c_put * self.p[start:end] * \
+            np.sqrt(self.n[node] + self.vl[node]) / (1 + n)
+        child = start + int(np.argmax(q + u))
+
+        return self.action[child], child
+
+    def _add_virtual_loss(self, node, loss):
+        """Add virtual losses along the path of a leaf.
+
+        # Arguments
+            node: Integer, index of the leaf.
+            loss: Integer, number of virtual losses to add, negative to
+                revert them.
+        """
+        while node >= 0:
+            self.vl[node] += loss
+            node = self.parent[node]
+
+    def _expand(self, node, actions, priors):
+        """Expand a leaf with the legal actions and their priors.
+        The children are allocated as one block at the top of the arrays.
+
+        # Arguments
+            node: Integer, index of the leaf.
+            actions: List, legal actions of the leaf.
+            priors: ndarray, prior probability of every action.
+        """
+        size = len(actions)
+        self._grow(size)
+
+        start, end = self.top, self.top + size
+        self._init_nodes(start, end)
+        self.action[start:end] = actions
+        self.p[start:end] = priors
+        self.parent[start:end] = node
+        self.first[node] = start
+        self.count[node] = size
+        self.top = end
+
+    def _backup(self, node, value):
+        """Propagate the value of a leaf back to the root.
+
+        # Arguments
+            node: Integer, index of the leaf.
+            value: Float, value of the leaf from the view of the player who
+                moved into it.
+        """
+        # w accumulates the values from the view of the player who moved
+        # into the node, so the sign flips at every level.
+        while node >= 0:
+            self.n[node] += 1
+            self.w[node] += value
+            value = -value
+            node = self.parent[node]
+
+    def _root_visits(self):
+        """Get the visit counts of the root children.
+
+        # Returns
+            acts: tuple, actions.
+            visits: tuple, visit counts of the actions.
+        """
+        start = self.first[self.root]
+        end = start + self.count[self.root]
+
+        return tuple(self.action[start:end]), tuple(self.n[start:end])
+
+    def tree_size(self):
+        """Get the number of nodes of the tree.
+
+        # Returns
+            Integer, number of nodes.
+        """
+        return self.top
+
+    def get_root_visited(self):
+        """Get the visit count of the root node.
+
+        # Returns
+            Integer, visits of the root.
+        """
+        return int(self.n[self.root])
+
+    def update_with_move(self, last_move):
+        """Step forward in the tree.
+        keeping everything we already know about the subtree.
+
+        The subtree of the move is copied block by block into the spare
+        arrays, which then become the tree, so the nodes of the pruned
+        branches are recycled by the next expansions.
+
+        # Arguments
+            last_move: Integer, last action move.
+        """
+        root = -1
+        if not self._is_leaf(self.root):
+            start = self.first[self.root]
+            end = start + self.count[self.root]
+            hit = np.flatnonzero(self.action[start:end] == last_move)
+            if len(hit):
+                root = start + hit[0]
+
+        if root < 0:
+            self._reset()
+            return
+
+        old, new = self.tree, self.spare
+        for key in old:
+            new[key][0] = old[key][root]
+        new['parent'][0] = -1
+
+        top = 1
+        queue = [(root, 0)]
+        while queue:
+            src, dst = queue.pop()
+            if old['first'][src] < 0:
+                continue
+
+            start = old['first'][src]
+            size = old['count'][src]
+            for key in old:
+                new[key][top:top + size] = old[key][start:start + size]
+            new['parent'][top:top + size] = dst
+            new['first'][dst] = top
+
+            for i in np.flatnonzero(old['first'][start:start + size] >= 0):
+                queue.append((start + i, top + i))
+            top += size
+
+        self.spare = old
+        self._set_tree(new)
+        self.root = 0
+        self.top = top
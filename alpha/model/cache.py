@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded caches shared by the search and the players.
+"""
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from .. import config as c
+from ..game import symmetry
+
+
+_slot = []  # memory per entry of an OrderedDict, measured once
+
+
+def _dict_slot():
+    """Get the largest memory per entry of an OrderedDict, reached right
+    after its table grows. Tables of 2^17 entries use the index width of
+    any realistic cache.
+
+    # Returns
+        Float, bytes per entry.
+    """
+    if not _slot:
+        d = OrderedDict()
+        empty = sys.getsizeof(d)
+        size = 0
+        for i in range(1, 2 ** 17):
+            d[i] = None
+            if i >= 64:
+                size = max(size, (sys.getsizeof(d) - empty) / i)
+        _slot.append(size)
+
+    return _slot[0]
+
+
+class LRUCache(object):
+    """
+    Dict with a max number of entries, the least recently used entry is
+    evicted first. Hits and misses are counted. The entries can be cleared
+    from another thread than the one using them.
+    """
+
+    def __init__(self, capacity):
+        """Init.
+
+        # Arguments
+            capacity: Integer, max number of entries.
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Look up an entry.
+
+        # Arguments
+            key: hashable, key of the entry.
+
+        # Returns
+            The entry, None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+
+        return entry
+
+    def put(self, key, entry):
+        """Store an entry, evicting the least recently used one when full.
+
+        # Arguments
+            key: hashable, key of the entry.
+            entry: value to store.
+        """
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        """Get the ratio of lookups that hit.
+
+        # Returns
+            Float, hit rate.
+        """
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def clear(self):
+        """Drop all the entries and reset the counters.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class EvaluationCache(LRUCache):
+    """
+    Cache of policy value network outputs in front of a network call.
+
+    Positions are keyed by their packed input planes. With symmetry, all the
+    8 dihedral variants of a position share one entry: the key is the
+    smallest packed variant and the policy is stored in that frame.
+    """
+
+    def __init__(self, evaluate, budget=c.EVAL_CACHE_MB,
+                 symmetric=c.EVAL_CACHE_SYMMETRY):
+        """Init.
+
+        # Arguments
+            evaluate: function, network call taking a batch of states and
+                returning the values and the policies.
+            budget: Float, memory budget of the cache in MB.
+            symmetric: Boolean, share entries between symmetric positions.
+        """
+        # an entry as stored by __call__, measured with its dict slot
+        key = bytes((int(np.prod(c.DIM)) + 7) // 8)
+        value = np.float32(0)
+        policy = np.zeros(c.DIM[1] * c.DIM[2], dtype=np.float32)
+        entry = sum(sys.getsizeof(x) for x in
+                    [key, value, policy, (value, policy)]) + _dict_slot()
+        super(EvaluationCache, self).__init__(
+            int(budget * 2 ** 20 / entry))
+
+        self.evaluate = evaluate
+        self.symmetric = symmetric
+        self.size = c.DIM[1:]
+        self.version = 0    # bumped by every clear
+
+    def _keys(self, states):
+        """Get the canonical key of every state.
+
+        # Arguments
+            states: ndarray, batch of states.
+
+        # Returns
+            keys: List, bytes key per state.
+            ks: List, symmetry mapping each state to its key frame.
+        """
+        n = len(states)
+        ks = list(range(symmetry.N_SYMMETRY)) if self.symmetric else [0]
+        variants = np.stack([symmetry.transform(states, k).reshape(n, -1)
+                             for k in ks], axis=1)
+        packed = np.packbits(variants > 0, axis=2)
+
+        keys, frames = [], []
+        for i in range(n):
+            rows = [packed[i, j].tobytes() for j in range(len(ks))]
+            j = min(range(len(ks)), key=rows.__getitem__)
+            keys.append(rows[j])
+            frames.append(ks[j])
+
+        return keys, frames
+
+    def __call__(self, states):
+        """Evaluate a batch of states, calling the network for misses only.
+
+        # Arguments
+            states: ndarray, batch of states for network input.
+
+        # Returns
+            values: ndarray, value output.
+            policies: ndarray, policy output.
+        """
+        n = len(states)
+        version = self.version
+        keys, ks = self._keys(states)
+        values = np.zeros((n, 1), dtype=np.float32)
+        policies = np.zeros((n, self.size[0] * self.size[1]), dtype=np.float32)
+
+        miss = []
+        for i in range(n):
+            entry = self.get(keys[i])
+            if entry is None:
+                miss.append(i)
+                continue
+            value, policy = entry
+            values[i] = value
+            policies[i] = symmetry.transform_policy(
+                policy[np.newaxis], symmetry.inverse(ks[i]), self.size)[0]
+
+        if miss:
+            value, policy = self.evaluate(states[miss])
+            values[miss] = np.reshape(value, (-1, 1))
+            policies[miss] = policy
+
+            entries = []
+            for i in miss:
+                canonical = symmetry.transform_policy(
+                    policies[i:i + 1], ks[i], self.size)[0]
+                entries.append((keys[i], (values[i, 0], canonical.copy())))
+
+            with self.lock:
+                # outputs of weights replaced during the call are not kept
+                if self.version == version:
+                    for key, entry in entries:
+                        self.put(key, entry)
+
+        return values, policies
+
+    def clear(self):
+        """Drop all the entries, the outputs being computed are not kept.
+        """
+        with self.lock:
+            super(EvaluationCache, self).clear()
+            self.version += 1
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Pure NumPy inference of an exported PolicyValueNet.
+
+`export` folds every BatchNormalization into the convolution before it and
+saves the weights to a .npz file. `NumpyEngine` loads that file and runs the
+forward pass with one matrix product per layer, so playing needs neither
+Keras nor TensorFlow.
+
+`quantize` stores an export with float16 or int8 weights, a 2x or 4x smaller
+file. This only compresses the stored weights: NumPy has no float16 or int8
+matrix product, so the engine converts the kernels back to float32 at load
+and runs at float32 speed, only the rounding of the weights changes the
+outputs.
+"""
+import numpy as np
+
+from .. import config as c
+from .. import profiler
+
+
+ALPHA = 0.3     # slope of the Keras LeakyReLU
+
+
+def _fold(conv, bn):
+    """Fold a BatchNormalization into the convolution before it.
+
+    # Arguments
+        conv: Layer, Conv2D layer.
+        bn: Layer, BatchNormalization layer on the channels of conv.
+
+    # Returns
+        kernel: ndarray(kh, kw, in, out), folded kernel.
+        bias: ndarray(out), folded bias.
+    """
+    kernel, bias = conv.get_weights()
+    gamma, beta, mean, var = bn.get_weights()
+    scale = gamma / np.sqrt(var + bn.epsilon)
+
+    return kernel * scale, (bias - mean) * scale + beta
+
+
+def _dense(layer, channels):
+    """Get the weights of a dense layer on a flattened convolution output.
+
+    Flatten runs on the channels first tensor of Keras while the engine
+    keeps the channels last, so the rows of the kernel are reordered.
+
+    # Arguments
+        layer: Layer, Dense layer.
+        channels: Integer, channels of the flattened tensor.
+
+    # Returns
+        kernel: ndarray(in, out), kernel.
+        bias: ndarray(out), bias.
+    """
+    kernel, bias = layer.get_weights()
+    out = kernel.shape[1]
+    kernel = kernel.reshape(channels, -1, out).transpose(1, 0, 2)
+
+    return kernel.reshape(-1, out), bias
+
+
+def export(model, path=c.ENGINE_PATH):
+    """Export the weights of a PolicyValueNet for the NumPy engine.
+
+    # Arguments
+        model: Model, Keras model built by `PolicyValueNet.get_model`.
+        path: String, .npz file.
+    """
+    weights = {}
+
+    def unit(name):
+        kernel, bias = _fold(model.get_layer(name + '_conv'),
+                             model.get_layer(name + '_bn'))
+        weights[name + '_w'], weights[name + '_b'] = kernel, bias
+        return kernel.shape[3]
+
+    unit('stem')
+    names = set(layer.name for layer in model.layers)
+    k = 0
+    while 'res%d_1_conv' % k in names:
+        unit('res%d_1' % k)
+        unit('res%d_2' % k)
+        k += 1
+
+    channels = unit('value')
+    weights['value_dense_w'], weights['value_dense_b'] = _dense(
+        model.get_layer('value_dense'), channels)
+    weights['value_output_w'], weights['value_output_b'] = \
+        model.get_layer('value_output').get_weights()
+
+    channels = unit('policy')
+    weights['policy_output_w'], weights['policy_output_b'] = _dense(
+        model.get_layer('policy_output'), channels)
+
+    np.savez(path, **{name: w.astype(np.float32)
+                      for name, w in weights.items()})
+
+
+def quantize(path, out, precision):
+    """Store an exported network with reduced precision weights.
+
+    # Arguments
+        path: String, .npz file written by `export`.
+        out: String, .npz file of the quantized network.
+        precision: String, 'float16' or 'int8'.
+    """
+    engine = NumpyEngine(path)
+    weights = dict(engine.weights)
+
+    if precision == 'float16':
+        for name in engine.layers:
+            weights[name + '_w'] = weights[name + '_w'].astype(np.float16)
+    elif precision == 'int8':
+        for name in engine.layers:
+            kernel = weights[name + '_w']
+            # one scale per output channel
+            axes = tuple(range(kernel.ndim - 1))
+            scale = np.maximum(np.abs(kernel).max(axis=axes), 1e-8) / 127
+            weights[name + '_w'] = np.rint(kernel / scale).astype(np.int8)
+            weights[name + '_scale'] = scale.astype(np.float32)
+    else:
+        raise Exception('Unknown precision %s' % precision)
+
+    np.savez(out, **weights)
+
+
+def _leaky_relu(x):
+    return np.maximum(x, ALPHA * x)
+
+
+class NumpyEngine(object):
+    """
+    Forward pass of an exported PolicyValueNet.
+    """
+
+    def __init__(self, path=c.ENGINE_PATH):
+        """Init.
+
+        # Arguments
+            path: String, .npz file written by `export`.
+        """
+        with np.load(path) as f:
+            self.weights = {name: f[name] for name in f.files}
+
+        self.layers = [name[:-2] for name in self.weights
+                       if name.endswith('_w')]
+        # kernels as float32 matrices for BLAS, int8 ones dequantized once
+        self.kernels = {}
+        for name in self.layers:
+            kernel = self.weights[name + '_w']
+            kernel = kernel.reshape(-1, kernel.shape[-1]).astype(np.float32)
+            if name + '_scale' in self.weights:
+                kernel *= self.weights[name + '_scale']
+            self.kernels[name] = kernel
+
+        self.blocks = 0
+        while 'res%d_1_w' % self.blocks in self.weights:
+            self.blocks += 1
+
+    def _dense(self, x, name):
+        """Matrix product of a layer.
+
+        # Arguments
+            x: ndarray(n, in), input.
+            name: String, name of the layer.
+
+        # Returns
+            Output.
+        """
+        return x.dot(self.kernels[name]) + self.weights[name + '_b']
+
+    def _conv(self, x, name):
+        """Convolution with 'same' padding as a single matrix product.
+
+        # Arguments
+            x: ndarray(n, height, width, channels), input.
+            name: String, name of the folded layer.
+
+        # Returns
+            Output, channels last.
+        """
+        kh, kw, channels, filters = self.weights[name + '_w'].shape
+        n, height, width, _ = x.shape
+
+        if kh == kw == 1:
+            cols = x
+        else:
+            ph, pw = kh // 2, kw // 2
+            padded = np.zeros((n, height + 2 * ph, width + 2 * pw, channels),
+                              dtype=x.dtype)
+            padded[:, ph:ph + height, pw:pw + width] = x
+            # patches in the (row, col, channel) order of the kernel
+            cols = np.concatenate([padded[:, i:i + height, j:j + width]
+                                   for i in range(kh) for j in range(kw)],
+                                  axis=3)
+
+        # a 2D product runs in BLAS, ndarray.dot on 4D arrays does not
+        out = self._dense(cols.reshape(n * height * width, -1), name)
+
+        return out.reshape(n, height, width, filters)
+
+    @profiler.phase('network.engine')
+    def __call__(self, states):
+        """Get the value output and policy output.
+
+        # Arguments
+            states: ndarray, batch of states for network input.
+
+        # Returns
+            value: ndarray, value output.
+            policy: ndarray, policy output.
+        """
+        n = len(states)
+        x = np.asarray(states, dtype=np.float32).transpose(0, 2, 3, 1)
+
+        x = _leaky_relu(self._conv(x, 'stem'))
+        for i in range(self.blocks):
+            y = _leaky_relu(self._conv(x, 'res%d_1' % i))
+            x = _leaky_relu(x + self._conv(y, 'res%d_2' % i))
+
+        value = _leaky_relu(self._conv(x, 'value')).reshape(n, -1)
+        value = _leaky_relu(self._dense(value, 'value_dense'))
+        value = np.tanh(self._dense(value, 'value_output'))
+
+        policy = _leaky_relu(self._conv(x, 'policy')).reshape(n, -1)
+        logits = self._dense(policy, 'policy_output')
+        policy = np.exp(logits - logits.max(axis=1, keepdims=True))
+        policy /= policy.sum(axis=1, keepdims=True)
+
+        return value, policy
@@ -13,6 +13,12 @@ from keras.regularizers import l2
 from keras.optimizers import Adam
 
 
+def _name(prefix, suffix):
+    """Get a layer name, None lets Keras name the layer.
+    """
+    return None if prefix is None else prefix + suffix
+
+
 class PolicyValueNet(object):
     def __init__(self, shape, k, filters, kernels):
         """MobileNetv2
@@ -30,7 +36,7 @@ class PolicyValueNet(object):
         self.filters = filters
         self.kernels = kernels
 
-    def _conv2d_unit(self, x, filters, kernels, strides=(1, 1)):
+    def _conv2d_unit(self, x, filters, kernels, strides=(1, 1), name=None):
         """Convolution Unit
         This function defines a 2D convolution operation with BN and LeakyReLU.
 
@@ -43,6 +49,7 @@ class PolicyValueNet(object):
               specifying the strides of the convolution along the width and
               height. Can be a single integer to specify the same value for
               all spatial dimensions.
+            name: String, prefix of the layer names.
 
         # Returns
             Output tensor.
@@ -52,13 +59,15 @@ class PolicyValueNet(object):
                    strides=strides,
                    activation='linear',
                    kernel_regularizer=l2(5e-4),
-                   data_format="channels_first")(x)
-        x = BatchNormalization(axis=1)(x)
+                   data_format="channels_first",
+                   name=_name(name, '_conv'))(x)
+        x = BatchNormalization(axis=1, name=_name(name, '_bn'))(x)
         x = LeakyReLU()(x)
 
         return x
 
-    def _residual_block(self, inputs, filters, kernels, strides=(1, 1)):
+    def _residual_block(self, inputs, filters, kernels, strides=(1, 1),
+                        name=None):
         """Residual Block
         This function defines a 2D convolution operation with BN and LeakyReLU.
 
@@ -71,18 +80,21 @@ class PolicyValueNet(object):
               specifying the strides of the convolution along the width and
               height. Can be a single integer to specify the same value for
               all spatial dimensions.
+            name: String, prefix of the layer names.
 
         # Returns
             Output tensor.
         """
-        x = self._conv2d_unit(inputs, 2 * filters, kernels, strides)
+        x = self._conv2d_unit(inputs, 2 * filters, kernels, strides,
+                              name=_name(name, '_1'))
         x = Conv2D(filters, kernels,
                    padding='same',
                    strides=strides,
                    activation='linear',
                    kernel_regularizer=l2(5e-4),
-                   data_format="channels_first")(x)
-        x = BatchNormalization(axis=1)(x)
+                   data_format="channels_first",
+                   name=_name(name, '_2_conv'))(x)
+        x = BatchNormalization(axis=1, name=_name(name, '_2_bn'))(x)
         x = add([inputs, x])
         x = LeakyReLU()(x)
 
@@ -97,9 +109,10 @@ class PolicyValueNet(object):
         # Returns
             Output tensor.
         """
-        x = self._conv2d_unit(x, 1, (1, 1), (1, 1))
+        x = self._conv2d_unit(x, 1, (1, 1), (1, 1), name='value')
         x = Flatten()(x)
-        x = Dense(20, activation='linear', kernel_regularizer=l2(5e-4))(x)
+        x = Dense(20, activation='linear', kernel_regularizer=l2(5e-4),
+                  name='value_dense')(x)
         x = LeakyReLU()(x)
         x = Dense(1, activation='tanh', kernel_regularizer=l2(5e-4),
                   name='value_output')(x)
@@ -116,7 +129,7 @@ class PolicyValueNet(object):
             Output tensor.
         """
         out_dims = self.dims[1] * self.dims[2]
-        x = self._conv2d_unit(x, 2, (1, 1), (1, 1))
+        x = self._conv2d_unit(x, 2, (1, 1), (1, 1), name='policy')
         x = Flatten()(x)
         x = Dense(out_dims, activation='softmax', kernel_regularizer=l2(5e-4),
                   name='policy_output')(x)
@@ -131,10 +144,12 @@ class PolicyValueNet(object):
             PolicyValueNet model.
         """
         inputs = Input(shape=self.dims, name='inputs')
-        x = self._conv2d_unit(inputs, self.filters, self.kernels)
+        x = self._conv2d_unit(inputs, self.filters, self.kernels,
+                              name='stem')
 
         for i in range(self.k):
-            x = self._residual_block(x, self.filters, self.kernels)
+            x = self._residual_block(x, self.filters, self.kernels,
+                                     name='res%d' % i)
 
         value_output = self._value_output(x)
         policy_output = self._policy_output(x)
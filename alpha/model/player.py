@@ -2,14 +2,17 @@
 """
 Player of Gomoku.
 """
+import copy
+import threading
 from abc import ABCMeta, abstractmethod
 
 from .. import config as c
+from .. import profiler
 from .policy_mcts import MCTS as PolicyMCTS
-from .model import PolicyValueNet
+from .array_mcts import ArrayMCTS
+from .cache import EvaluationCache
 
 import numpy as np
-from keras.utils.vis_utils import plot_model
 
 
 class Player(metaclass=ABCMeta):
@@ -53,43 +56,164 @@ class AlphaZeroPlayer(Player):
     AlphaZeroPlayer consisting of PolicyValue net and MCTS.
     """
 
-    def __init__(self, selfplay=0, init=0):
+    def __init__(self, selfplay=0, init=0, evaluator=None, engine=0):
         """Init.
 
         # Arguments
             selfplay: Boolean, if self play.
             init: Boolean, if load the model.
+            evaluator: function, external policy value network call, e.g.
+                an InferenceClient; no model is built when it is given.
+            engine: Boolean, play with the exported NumPy network instead
+                of building the Keras model, the player cannot be trained.
         """
         self.id = 'ai'
         self.selfplay = selfplay
-        self.model = PolicyValueNet(c.DIM, c.K,
-                                    c.FILTERS, c.KERNELS).get_model()
-        if not init:
-            self.model.load_weights('alpha\data\pvmodel.h5')
-        self.mcts = PolicyMCTS(c.c_puct, c.N_SIMULATE)
+        self.model = None
+        self.graph = None
+        self.cache = None
+
+        own = evaluator is None
+        if own and engine:
+            from .engine import NumpyEngine
+
+            evaluator = NumpyEngine(c.ENGINE_PATH)
+        elif own:
+            # imported here so that the engine plays without Keras
+            from keras import backend as K
+            from keras.utils.vis_utils import plot_model
+            from .model import PolicyValueNet
+
+            self.model = PolicyValueNet(c.DIM, c.K,
+                                        c.FILTERS, c.KERNELS).get_model()
+            if not init:
+                self.model.load_weights('alpha/data/pvmodel.h5')
+            # call the graph directly, predict() costs more than the network
+            # itself for a single position.
+            self.predict = K.function(
+                self.model.inputs + [K.learning_phase()], self.model.outputs)
+            evaluator = self._get_value_policy
+            self.graph = K.get_session().graph
+
+            plot_model(self.model, to_file='images/PolicyValueNet.png', show_shapes=True)
+
+        if own and c.EVAL_CACHE_MB:
+            # an external evaluator owns the weights, so only the player's
+            # own network can be cached
+            self.cache = EvaluationCache(evaluator)
+            evaluator = self.cache
+
+        # self-play keeps a fixed search so training data does not depend
+        # on the hardware
+        time_budget = 0 if selfplay else c.TIME_BUDGET
+        if c.ARRAY_TREE:
+            self.mcts = ArrayMCTS(evaluator, c.c_puct,
+                                  c.N_SIMULATE, c.COPY_FREE,
+                                  c.BATCH_MCTS, c.VIRTUAL_LOSS,
+                                  time_budget, c.EARLY_STOP, c.TT_SIZE,
+                                  c.TREE_NODES)
+        else:
+            self.mcts = PolicyMCTS(evaluator, c.c_puct,
+                                   c.N_SIMULATE, c.COPY_FREE,
+                                   c.BATCH_MCTS, c.VIRTUAL_LOSS,
+                                   time_budget, c.EARLY_STOP, c.TT_SIZE)
 
-        plot_model(self.model, to_file='images/PolicyValueNet.png', show_shapes=True)
+        self.moves = []     # moves of the game the MCTS root stands for
+        self.reused = 0     # visits kept from the previous search
+        self.ponder = None  # (thread, stop event) while pondering
 
     def reset_player(self):
         """# reset MCTS root node.
         """
         self.mcts.update_with_move(-1)
+        self.moves = []
+
+    def _sync(self, board):
+        """Advance the MCTS root through the moves played since the last
+        search, including the opponent's, keeping the matching subtree.
+
+        # Arguments
+            board: check board.
+        """
+        n = len(self.moves)
+        if board.states[:n] != self.moves:
+            # another game, nothing to keep
+            self.reset_player()
+            n = 0
+
+        for move in board.states[n:]:
+            # falls back to a new root on a tree miss
+            self.mcts.update_with_move(move)
+            self.moves.append(move)
+
+    def start_pondering(self, board):
+        """Keep searching the current position in a background thread while
+        the opponent thinks, the subtree of the opponent's move is reused
+        by the next `get_action`.
+
+        # Arguments
+            board: check board, the opponent is to move.
+        """
+        if self.ponder or board.get_game_status()[0] != -1:
+            return
+
+        self._sync(board)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._ponder,
+                                  args=(copy.deepcopy(board), stop))
+        thread.daemon = True
+        self.ponder = (thread, stop)
+        thread.start()
+
+    def stop_pondering(self):
+        """Stop the background search.
+        """
+        if self.ponder:
+            thread, stop = self.ponder
+            stop.set()
+            thread.join()
+            self.ponder = None
 
+    def _ponder(self, board, stop):
+        """Run simulations until stopped or the tree is large enough.
+
+        # Arguments
+            board: check board, a private copy of the game board.
+            stop: Event, set to stop the search.
+        """
+        if self.graph is not None:
+            # Keras graphs are thread local
+            with self.graph.as_default():
+                self._ponder_loop(board, stop)
+        else:
+            self._ponder_loop(board, stop)
+
+    def _ponder_loop(self, board, stop):
+        """Pondering loop, see `_ponder`.
+        The tree stays within TREE_NODES, a batch expands at most one
+        node per cell for each of its leaves.
+        """
+        nodes = c.TREE_NODES - self.mcts.batch * board.size[0] * board.size[1]
+        n = 0
+        while not stop.is_set() and n < c.PONDER_LIMIT and \
+                self.mcts.tree_size() < nodes:
+            n += self.mcts._simulate(board, self.mcts.batch)
+
+    @profiler.phase('network.predict')
     def _get_value_policy(self, states):
         """Get the value output and policy output.
 
         # Arguments
-            states: states for network input.
+            states: ndarray, batch of states for network input.
         # Returns
-            value: Integer, value output.
+            value: ndarray, value output.
             policy: ndarray, policy output.
         """
-        states = np.expand_dims(states, axis=0)
-        predicted = self.model.predict(states)
-        value, policy = predicted
+        value, policy = self.predict([states.astype(np.float32), 0])
 
-        return value[0], policy[0]
+        return value, policy
 
+    @profiler.phase('player.get_action')
     def get_action(self, board, return_prob=0):
         """Get the next move and total move_probs.
 
@@ -100,32 +224,52 @@ class AlphaZeroPlayer(Player):
             move: Integer, piece position.
             move_probs: policy
         """
-        value, policy = self._get_value_policy(board.get_current_states())
-        availables = board.get_availables()
+        self.stop_pondering()
+        self._sync(board)
+        self.reused = self.mcts.get_root_visited()
 
-        act_probs = zip(availables, policy[availables])
+        n_simulate = None
+        if not self.selfplay:
+            # the visits kept from the previous search and from pondering
+            # count toward the budget, self-play keeps a fixed search
+            n_simulate = max(self.mcts.n_simulate - self.reused, 0)
+        acts, probs = self.mcts.get_move_probs(board, n_simulate)
 
-        acts, probs = self.mcts.get_move_probs(board, act_probs, value)
+        return self.play(board, acts, probs, return_prob)
 
-        move_probs = np.zeros(len(policy))
+    def play(self, board, acts, probs, return_prob=0):
+        """Choose the move from the search result and step the tree.
+
+        # Arguments
+            board: check board.
+            acts: tuple, actions of the root.
+            probs: ndarray, probabilities of the actions.
+            return_prob, if return the probs.
+        # Returns
+            move: Integer, piece position.
+            move_probs: policy
+        """
+        move_probs = np.zeros(board.size[0] * board.size[1])
         move_probs[list(acts)] = probs
 
         if self.selfplay:
             # add Dirichlet Noise for exploration (for self-play training)
             p = 0.75 * probs + 0.25 * np.random.dirichlet(0.3 * np.ones(len(probs)))
             move = np.random.choice(acts, p=p)
-            self.mcts.update_with_move(move)
         else:
             # choosing the move with the highest prob
             move = np.random.choice(acts, p=probs)
-            # reset the root node
-            self.reset_player()
+
+        # keep the subtree of the move for the next turn
+        self.mcts.update_with_move(move)
+        self.moves.append(int(move))
 
         if return_prob:
             return move, move_probs
         else:
             return move
 
+    @profiler.phase('player.update')
     def update(self, states, values, probs):
         """Updata the policy value network with pre states.
 
@@ -141,9 +285,11 @@ class AlphaZeroPlayer(Player):
         loss = []
 
         h = self.model.fit(
-            states, {'value_output': values, 'policy_output': probs},
+            states.astype(np.float32), {'value_output': values, 'policy_output': probs},
             verbose=0, batch_size=c.BATCH, epochs=c.TRAIN_EPOCHS)
 
+        self.invalidate()
+
         df = h.history
         loss.append(df['loss'][-1])
         loss.append(df['value_output_loss'][-1])
@@ -151,7 +297,67 @@ class AlphaZeroPlayer(Player):
 
         return loss
 
+    @profiler.phase('player.train_step')
+    def train_step(self, states, values, probs):
+        """Run one gradient step on a minibatch.
+        The cached network outputs are kept, self-play sharing the model
+        calls `invalidate` when it takes the new weights.
+
+        # Arguments
+            states: ndarray, states for network input.
+            value: ndarray, value output.
+            policy: ndarray, policy output.
+
+        # Returns
+            loss: List, train loss, value loss and policy loss.
+        """
+        loss = self.model.train_on_batch(
+            states.astype(np.float32), {'value_output': values, 'policy_output': probs})
+
+        return loss
+
+    @profiler.phase('player.train_dataset')
+    def train_dataset(self, dataset, epochs=1):
+        """Train the policy value network on a memory-mapped dataset.
+
+        # Arguments
+            dataset: Dataset, positions to train on.
+            epochs: Integer, passes over the dataset.
+
+        # Returns
+            loss: List, train loss, value loss and policy loss of the
+                last epoch.
+        """
+        h = self.model.fit_generator(
+            dataset.generator(), steps_per_epoch=dataset.steps_per_epoch(),
+            epochs=epochs, verbose=1)
+
+        self.invalidate()
+
+        df = h.history
+
+        return [df['loss'][-1], df['value_output_loss'][-1],
+                df['policy_output_loss'][-1]]
+
+    def invalidate(self):
+        """Drop the network outputs kept for the previous weights, safe to
+        call while another thread searches.
+        """
+        if self.cache is not None:
+            self.cache.clear()
+        self.mcts.clear_tt()
+
+    def load_weights(self, path):
+        """Load the policyvalue network weights, the cached network outputs
+        of the previous weights are dropped.
+
+        # Arguments
+            path: String, weights file.
+        """
+        self.model.load_weights(path)
+        self.invalidate()
+
     def save_model(self):
         """Save the current policyvalue network model.
         """
-        self.model.save_weights('alpha\data\pvmodel.h5')
+        self.model.save_weights('alpha/data/pvmodel.h5')
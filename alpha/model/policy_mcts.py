@@ -4,8 +4,16 @@ Monte Carlo Tree Search in AlphaGo Zero style, which uses a output policy of
 policy-value network to guide the tree search and evaluate the leaf nodes.
 """
 import copy
+import time
 import numpy as np
 
+from .. import config as c
+from .. import profiler
+from .cache import LRUCache
+
+
+_deepcopy = profiler.phase('mcts.deepcopy')(copy.deepcopy)
+
 
 class TreeNode(object):
     """
@@ -25,6 +33,7 @@ class TreeNode(object):
         self.v = 0  # own value
         self.p = prior_p  # prior policy from pvnet
         self.u = 0  # visit-count-adjusted prior score
+        self.virtual = 0    # virtual losses of pending evaluations
 
     def expand(self, action_priors):
         """Expand tree by creating new child node.
@@ -72,6 +81,20 @@ class TreeNode(object):
             self.parent.update_recursive(-leaf_value)
         self.update(leaf_value)
 
+    def add_virtual_loss(self, loss):
+        """Count pending visits as losses on this node and its ancestors.
+        Keeps the next selections of a batch away from this path until the
+        leaf evaluation is backed up.
+
+        # Arguments
+            loss: Integer, number of virtual losses to add, negative to
+                revert them.
+        """
+        node = self
+        while node:
+            node.virtual += loss
+            node = node.parent
+
     def get_value(self, c):
         """Calculate and return the value for this node.
 
@@ -83,9 +106,16 @@ class TreeNode(object):
             a combination of leaf evaluations v and this node's prior
             adjusted for its visit count u.
         """
-        self.u = c * self.p * np.sqrt(self.parent.visited) / (1 + self.visited)
+        if self.virtual:
+            visited = self.visited + self.virtual
+            v = (self.v * self.visited - self.virtual) / visited
+        else:
+            visited = self.visited
+            v = self.v
+        parent = self.parent.visited + self.parent.virtual
+        self.u = c * self.p * np.sqrt(parent) / (1 + visited)
 
-        return self.v + self.u
+        return v + self.u
 
     def is_leaf(self):
         """Check if leaf node.
@@ -103,80 +133,345 @@ class MCTS(object):
     A simple implementation of Monte Carlo Tree Search.
     """
 
-    def __init__(self, c_put, n_simulate):
+    def __init__(self, policy_value_fn, c_put, n_simulate, copy_free=1,
+                 batch=1, virtual_loss=3, time_budget=0, early_stop=1,
+                 tt_size=0):
         """Init.
 
         # Arguments
+        policy_value_fn: function, takes a batch of states with shape
+            (n, channels, height, width) and returns the values with shape
+            (n, 1) and the policies with shape (n, height * width) for the
+            player to move.
         c_put: Integer, a number controlling the relative impact of
             values, v, and prior probability p on this node's score.
         n_simulate: Integer, simulate times.
+        copy_free: Boolean, simulate on the board itself and take the moves
+            back afterwards instead of simulating on a deep copy.
+        batch: Integer, max number of leaves evaluated in one network call.
+        virtual_loss: Integer, losses added to the path of a pending leaf.
+        time_budget: Integer, wall-clock budget per move in ms, 0 for no
+            limit.
+        early_stop: Boolean, stop once the remaining simulations cannot
+            change the most visited move.
+        tt_size: Integer, number of positions kept in the transposition
+            table, 0 disables it.
         """
         self.root = TreeNode(None, 1.0)
+        self.policy_value_fn = policy_value_fn
         self.c_put = c_put
         self.n_simulate = n_simulate
-
-    def _simulate(self, board, policy, value):
-        """Simluation.
-
-        Run a single simulate from the root to the leaf, getting a value at
-        the leaf and propagating it back through its parents. State is modified
-        in-place, so a copy must be provided.
+        self.copy_free = copy_free
+        self.batch = batch
+        self.virtual_loss = virtual_loss
+        self.time_budget = time_budget
+        self.early_stop = early_stop
+        self.simulations = 0    # simulations run by the last search
+        self.nodes = 1          # nodes of the tree, None until recounted
+        self.visits = None      # root (actions, visit counts) of it
+        # network evaluations shared by positions reached by different
+        # move orders, keyed by the Zobrist hash of the board. Only the
+        # pieces are compared, so the history planes of the first
+        # evaluation are reused for the others.
+        self.tt = LRUCache(tt_size) if tt_size else None
+        # network input of the pending leaves, converted to float32 by the
+        # network call
+        self.batch_states = np.zeros((batch,) + c.DIM, dtype=np.uint8)
+
+    @profiler.phase('mcts.select')
+    def _select(self, board):
+        """Descend from the root to a leaf.
+
+        State is modified in-place, so either a copy must be provided or the
+        moves must be taken back with `_rewind`.
 
         # Arguments
-        board: Board, a copy of current check board.
-        policy: tuple, (action, prob) from policy value network.
-        value: Double， value from policy value network.
+        board: Board, current check board or a copy of it.
+
+        # Returns
+            node: leaf node.
+            win: Integer, game status at the leaf.
+            depth: Integer, number of moves played on the board.
         """
         node = self.root
-        win, winner, cur = -1, 0, 0
+        win = -1
+        depth = 0
         while True:
-            if node.is_leaf():
+            if self._is_leaf(node):
                 break
             # Greedily select next move.
-            action, node = node.select(self.c_put)
+            action, node = self._select_child(node)
             board.move(action)
             win, winner = board.get_game_status()
-            cur = board.get_current_player()
             board.change_player()
+            depth += 1
 
-        if win == -1:
-            node.expand(policy)
-        else:
-            # for end state，return the "true" leaf_value.
-            if win == 0:
-                value = 0.0
+        return node, win, depth
+
+    @profiler.phase('mcts.simulate')
+    def _simulate(self, board, n):
+        """Simluation.
+
+        Run up to n simulates from the root to the leaves. End states are
+        backed up at once, other leaves get a virtual loss so that the next
+        descents spread over the tree, then all of them are evaluated with
+        one call of the policy value network and their values propagated
+        back through their parents.
+
+        # Arguments
+        board: Board, current check board.
+        n: Integer, max number of simulates.
+
+        # Returns
+            Integer, number of simulates done.
+        """
+        done, pending = self._collect(board, n)
+
+        if pending[0]:
+            values, policies = self.policy_value_fn(
+                self.batch_states[:len(pending[0])])
+            done += self._apply(pending, values, policies)
+
+        return done
+
+    def _collect(self, board, n):
+        """Descend up to n times and gather the leaves to evaluate.
+
+        The states of the leaves are written into `batch_states`, callers
+        evaluating the leaves of several trees at once pass the results to
+        `_apply`.
+
+        # Arguments
+        board: Board, current check board.
+        n: Integer, max number of simulates.
+
+        # Returns
+            done: Integer, number of simulates finished without the network.
+            pending: tuple, leaves, their actions and their hash keys.
+        """
+        done = 0
+        leaves, availables, keys = [], [], []
+
+        for _ in range(n):
+            b = board if self.copy_free else _deepcopy(board)
+            node, win, depth = self._select(b)
+
+            if win != -1:
+                # for end state，return the "true" leaf_value, the player to
+                # move has lost if the last move won.
+                value = 0.0 if win == 0 else -1.0
+                self._backup(node, -value)
+                done += 1
+            elif self._is_pending(node):
+                # the leaf is already waiting for evaluation
+                if self.copy_free:
+                    self._rewind(b, depth)
+                break
             else:
-                value = 1.0 if winner == cur else - 1.0
+                entry = self.tt.get(b.hash) if self.tt is not None else None
+                if entry is not None:
+                    # transposition of an evaluated position
+                    value, priors = entry
+                    self._expand(node, b.get_candidates(), priors)
+                    self._backup(node, -value)
+                    done += 1
+                else:
+                    self._add_virtual_loss(node, self.virtual_loss)
+                    b.get_current_states(out=self.batch_states[len(leaves)])
+                    leaves.append(node)
+                    availables.append(b.get_candidates())
+                    keys.append(b.hash)
+
+            if self.copy_free:
+                self._rewind(b, depth)
+
+        return done, (leaves, availables, keys)
+
+    def _apply(self, pending, values, policies):
+        """Expand the gathered leaves with their network outputs.
+
+        # Arguments
+            pending: tuple, leaves gathered by `_collect`.
+            values: ndarray, value output of the leaves.
+            policies: ndarray, policy output of the leaves.
+
+        # Returns
+            Integer, number of simulates done.
+        """
+        leaves, availables, keys = pending
+        values = np.ravel(values)
+
+        for i, node in enumerate(leaves):
+            priors = policies[i][availables[i]]
+            if self.tt is not None:
+                self.tt.put(keys[i], (values[i], priors))
+
+            self._add_virtual_loss(node, -self.virtual_loss)
+            self._expand(node, availables[i], priors)
+            # Update value and visit count of nodes in this traversal.
+            self._backup(node, -values[i])
+
+        return len(leaves)
+
+    def _is_leaf(self, node):
+        """Check if a node has not been expanded yet.
+        """
+        return node.is_leaf()
+
+    def _is_pending(self, node):
+        """Check if a leaf is waiting for its evaluation.
+        """
+        return node.virtual
+
+    def _select_child(self, node):
+        """Select the child with maximum action value.
 
-        # Update value and visit count of nodes in this traversal.
-        node.update_recursive(-value)
+        # Returns
+            tuple, (action, next_node)
+        """
+        return node.select(self.c_put)
+
+    def _add_virtual_loss(self, node, loss):
+        """Add virtual losses along the path of a leaf.
+        """
+        node.add_virtual_loss(loss)
+
+    def _expand(self, node, actions, priors):
+        """Expand a leaf with the legal actions and their priors.
+        """
+        size = len(node.children)
+        node.expand(zip(actions, priors))
+        if self.nodes is not None:
+            self.nodes += len(node.children) - size
 
-    def get_move_probs(self, board, policy, value):
+    def _backup(self, node, value):
+        """Propagate the value of a leaf back to the root.
+        """
+        node.update_recursive(value)
+
+    def _root_visits(self):
+        """Get the visit counts of the root children.
+
+        # Returns
+            acts: tuple, actions.
+            visits: tuple, visit counts of the actions.
+        """
+        act_visits = [(a, n.visited) for a, n in self.root.children.items()]
+
+        return tuple(zip(*act_visits))
+
+    def _rewind(self, board, depth):
+        """Take back the moves played by a simulation.
+
+        # Arguments
+        board: Board, check board the simulation was run on.
+        depth: Integer, number of moves to take back.
+        """
+        for _ in range(depth):
+            board.change_player()
+            board.unmove()
+
+    def _decided(self, remaining):
+        """Check if the most visited root move can still be overturned.
+
+        # Arguments
+            remaining: Integer, max number of simulations left.
+
+        # Returns
+            Boolean, if the best move can not change any more.
+        """
+        acts, visits = self._root_visits()
+        if len(visits) == 1:
+            return True
+
+        second, best = np.partition(np.array(visits), -2)[-2:]
+
+        return best - second > remaining
+
+    def get_move_probs(self, board, n_simulate=None, time_budget=None):
         """Get all move probs
-        Runs all simluation sequentially and returns the available actions
-        and their corresponding probabilities.
+        Runs simluations until the node or time budget is spent and returns
+        the available actions and their corresponding probabilities. The
+        number of simulations run is kept in `simulations` and the root
+        visit counts in `visits`.
 
         # Arguments
             board: Board, current check board.
-            policy: tuple, (action, prob) from policy value network.
-            value: Double， value from policy value network.
+            n_simulate: Integer, max number of simulations, defaults to the
+                simulate times of the search.
+            time_budget: Integer, wall-clock budget in ms, defaults to the
+                time budget of the search, 0 for no limit.
         """
-        temp = 1e-3
+        budget = self.n_simulate if n_simulate is None else n_simulate
+        ms = self.time_budget if time_budget is None else time_budget
+
+        start = time.time()
+        deadline = start + ms / 1000.0
 
-        for n in range(self.n_simulate):
-            board_copy = copy.deepcopy(board)
-            self._simulate(board_copy, policy, value)
+        n = 0
+        while n < budget:
+            n += self._simulate(board, min(self.batch, budget - n))
 
+            now = time.time()
+            if ms and now >= deadline:
+                break
+
+            if self.early_stop and not self._is_leaf(self.root):
+                remaining = budget - n
+                if ms:
+                    # simulations that fit in the time left at current speed
+                    rate = n / max(now - start, 1e-6)
+                    remaining = min(remaining, rate * (deadline - now))
+                if self._decided(remaining):
+                    break
+
+        self.simulations = n
+
+        return self._move_probs()
+
+    def _move_probs(self, temp=1e-3):
         """
         calc the move probabilities based on the visit counts at
         the root node
         """
-        act_visits = [(a, n.visited) for a, n in self.root.children.items()]
-        acts, visits = zip(*act_visits)
+        acts, visits = self._root_visits()
+        self.visits = (acts, visits)
         act_probs = self.softmax(1.0 / temp * np.log(np.array(visits) + 1e-10))
 
         return acts, act_probs
 
+    def clear_tt(self):
+        """Drop the network outputs kept by the transposition table, they
+        are stale once the weights of the network change.
+        """
+        if self.tt is not None:
+            self.tt.clear()
+
+    def tree_size(self):
+        """Get the number of nodes of the tree.
+        The subtree kept by a move is counted at the first call after it.
+
+        # Returns
+            Integer, number of nodes.
+        """
+        if self.nodes is None:
+            self.nodes = 0
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                self.nodes += 1
+                stack.extend(node.children.values())
+
+        return self.nodes
+
+    def get_root_visited(self):
+        """Get the visit count of the root node.
+
+        # Returns
+            Integer, visits of the root.
+        """
+        return self.root.visited
+
     def update_with_move(self, last_move):
         """Step forward in the tree.
         keeping everything we already know about the subtree.
@@ -186,8 +481,10 @@ class MCTS(object):
         if last_move in self.root.children:
             self.root = self.root.children[last_move]
             self.root.parent = None
+            self.nodes = None
         else:
             self.root = TreeNode(None, 1.0)
+            self.nodes = 1
 
     def softmax(self, x):
         """Softmax
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped training dataset for large position archives.
+
+States are stored one position per row as bit-packed planes, policies as
+float16 and values as int8, in append-only files that are memory-mapped for
+reading, so the size of the dataset is only bounded by the disk. Minibatches
+are unpacked to float32 when they are drawn.
+"""
+import os
+import numpy as np
+
+from .. import config as c
+from ..game import symmetry
+from .records import read_records, to_tensors
+
+
+def _files(path):
+    """Get the file of every array.
+    """
+    return {name: '{0}_{1}.bin'.format(path, name)
+            for name in ['states', 'probs', 'values']}
+
+
+class DatasetWriter(object):
+    """
+    Append-only writer of a position dataset.
+    """
+
+    def __init__(self, path=c.DATASET_PATH):
+        """Init.
+
+        # Arguments
+            path: String, prefix of the dataset files.
+        """
+        self.files = _files(path)
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def add(self, states, probs, values):
+        """Append positions.
+
+        # Arguments
+            states: ndarray, states for network input.
+            probs: ndarray, policy output.
+            values: ndarray, value output.
+        """
+        n = len(states)
+        arrays = {'states': np.packbits(states.reshape(n, -1) > 0, axis=1),
+                  'probs': probs.astype('<f2'),
+                  'values': np.asarray(values).astype(np.int8)}
+
+        # values last, a reader never sees a position before its state
+        for name in ['states', 'probs', 'values']:
+            with open(self.files[name], 'ab') as f:
+                f.write(arrays[name].tobytes())
+
+    def add_records(self, pattern=c.RECORD_PATH + '*.bin', games=100):
+        """Append the positions of archived game records.
+
+        # Arguments
+            pattern: String, glob pattern of the record files.
+            games: Integer, games decoded at once.
+
+        # Returns
+            Integer, number of positions added.
+        """
+        records = read_records(pattern)
+        n = 0
+        for i in range(0, len(records), games):
+            states, probs, values = to_tensors(records[i:i + games])
+            self.add(states, probs, values)
+            n += len(states)
+
+        return n
+
+
+class Dataset(object):
+    """
+    Shuffled minibatches over a memory-mapped position dataset.
+
+    An epoch reads the dataset in contiguous blocks, which are zero-copy
+    slices of the mapped files, in random order. The packed rows of a few
+    blocks are shuffled together before being cut into minibatches, so
+    that a minibatch mixes positions of many games while the disk is still
+    read sequentially.
+    """
+
+    def __init__(self, path=c.DATASET_PATH, batch=c.BATCH,
+                 block=c.DATASET_BLOCK, mix=c.DATASET_MIX,
+                 augment=c.AUGMENT > 0, dim=c.DIM):
+        """Init.
+
+        # Arguments
+            path: String, prefix of the dataset files.
+            batch: Integer, positions per minibatch.
+            block: Integer, contiguous positions read at once.
+            mix: Integer, blocks shuffled together.
+            augment: Boolean, apply a random symmetry to every position.
+            dim: tuple, shape of a state.
+        """
+        files = _files(path)
+        self.dim = dim
+        self.batch = batch
+        self.block = block
+        self.mix = mix
+        self.augment = augment
+
+        cells = dim[1] * dim[2]
+        width = (int(np.prod(dim)) + 7) // 8
+        # positions completely written, see DatasetWriter.add
+        n = os.path.getsize(files['values'])
+        if not n:
+            raise Exception('Dataset %s is empty' % path)
+        self.states = np.memmap(files['states'], np.uint8, 'r',
+                                shape=(n, width))
+        self.probs = np.memmap(files['probs'], '<f2', 'r', shape=(n, cells))
+        self.values = np.memmap(files['values'], np.int8, 'r', shape=(n,))
+
+    def __len__(self):
+        return len(self.values)
+
+    def steps_per_epoch(self):
+        """Get the number of minibatches of an epoch.
+        """
+        return (len(self) + self.batch - 1) // self.batch
+
+    def _unpack(self, states, probs, values):
+        """Unpack a minibatch for the network.
+        """
+        n = len(states)
+        states = np.unpackbits(states, axis=1)[:, :int(np.prod(self.dim))]
+        states = states.reshape((n,) + self.dim).astype(np.float32)
+        probs = probs.astype(np.float32)
+
+        if self.augment:
+            symmetry.random_symmetry(states, probs)
+
+        return states, values.astype(np.float32), probs
+
+    def epoch(self):
+        """Iterate over the shuffled minibatches of one epoch.
+
+        # Returns
+            Iterator of states, values and probs minibatches.
+        """
+        starts = np.random.permutation(np.arange(0, len(self), self.block))
+
+        for i in range(0, len(starts), self.mix):
+            slices = [slice(s, s + self.block) for s in starts[i:i + self.mix]]
+            states = np.concatenate([self.states[s] for s in slices])
+            probs = np.concatenate([self.probs[s] for s in slices])
+            values = np.concatenate([self.values[s] for s in slices])
+
+            order = np.random.permutation(len(values))
+            for j in range(0, len(order), self.batch):
+                index = order[j:j + self.batch]
+                yield self._unpack(states[index], probs[index],
+                                   values[index])
+
+    def generator(self):
+        """Minibatches forever, in the format of Keras `fit_generator`.
+
+        # Returns
+            Iterator of (states, {'value_output', 'policy_output'}).
+        """
+        while True:
+            for states, values, probs in self.epoch():
+                yield states, {'value_output': values,
+                               'policy_output': probs}
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Self-play of many games at once in a single process.
+
+Every game of the pool has its own board and player. At each step every
+game descends its tree to a few leaves, the leaves of all the games are
+evaluated with one network call and the results are scattered back to their
+trees, so the network sees large batches without worker processes.
+"""
+import time
+import numpy as np
+
+from .. import config as c
+from ..game.board import Board
+from ..model.player import AlphaZeroPlayer
+
+
+class _Slot(object):
+    """
+    A game in progress.
+    """
+
+    def __init__(self, player, start_player):
+        self.player = player
+        self.board = Board(c.SIZE, c.PIECE, start_player)
+        self.simulations = 0    # simulations of the current move
+        self.states, self.move_probs, self.players, self.visits = \
+            [], [], [], []
+
+
+class GamePool(object):
+    """
+    Runs G self-play games concurrently with batched evaluation.
+    """
+
+    def __init__(self, evaluate, games=c.POOL_GAMES, writer=None,
+                 n_simulate=c.N_SIMULATE):
+        """Init.
+
+        # Arguments
+            evaluate: function, policy value network call on a batch of
+                states, shared by all the games.
+            games: Integer, number of concurrent games.
+            writer: RecordWriter, finished games are appended to it.
+            n_simulate: Integer, simulations per move.
+        """
+        self.evaluate = evaluate
+        self.writer = writer
+        self.n_simulate = n_simulate
+        self.slots = [self._new_slot(AlphaZeroPlayer(selfplay=1,
+                                                     evaluator=evaluate))
+                      for _ in range(games)]
+        self.finished = []
+
+        self.positions = 0  # moves played, one training position each
+        self.batches = 0
+        self.leaves = 0
+        self.start_time = time.time()
+
+    def _new_slot(self, player):
+        player.reset_player()
+        return _Slot(player, 1)
+
+    def _searched(self, slot):
+        """Check if the search of the current move is over.
+        """
+        mcts = slot.player.mcts
+        if slot.simulations >= self.n_simulate:
+            return True
+
+        return mcts.early_stop and not mcts._is_leaf(mcts.root) and \
+            mcts._decided(self.n_simulate - slot.simulations)
+
+    def _move(self, i):
+        """Play the searched move of a game, the game is replaced by a new
+        one when it ends.
+        """
+        slot = self.slots[i]
+        board, player = slot.board, slot.player
+        mcts = player.mcts
+
+        mcts.simulations = slot.simulations
+        slot.simulations = 0
+        acts, probs = mcts._move_probs()
+
+        slot.states.append(board.get_current_states())
+        move, move_probs = player.play(board, acts, probs, 1)
+        board.move(move)
+        slot.move_probs.append(move_probs)
+        slot.players.append(board.get_current_player())
+        slot.visits.append(mcts.visits)
+        self.positions += 1
+
+        win, winner = board.get_game_status()
+        if win == -1:
+            board.change_player()
+            return
+
+        if win == 1:
+            values = np.array([1 if p == winner else -1
+                               for p in slot.players])
+        else:
+            values = np.zeros(len(slot.players))
+
+        if self.writer is not None:
+            self.writer.write(board.states, slot.visits,
+                              winner if win == 1 else 0, board.start_player)
+
+        self.finished.append((np.array(slot.states),
+                              np.array(slot.move_probs, dtype=np.float32),
+                              values))
+        self.slots[i] = self._new_slot(player)
+
+    def step(self):
+        """Run one batched simulation round over all the games.
+        """
+        pending = []
+        for slot in self.slots:
+            mcts = slot.player.mcts
+            n = min(mcts.batch, self.n_simulate - slot.simulations)
+            done, leaves = mcts._collect(slot.board, n)
+            slot.simulations += done
+            pending.append(leaves)
+
+        sizes = [len(leaves[0]) for leaves in pending]
+        if sum(sizes):
+            states = np.concatenate([
+                slot.player.mcts.batch_states[:size]
+                for slot, size in zip(self.slots, sizes)])
+            values, policies = self.evaluate(states)
+            self.batches += 1
+            self.leaves += len(states)
+
+            offset = 0
+            for slot, leaves, size in zip(self.slots, pending, sizes):
+                if size:
+                    slot.simulations += slot.player.mcts._apply(
+                        leaves, values[offset:offset + size],
+                        policies[offset:offset + size])
+                offset += size
+
+        for i, slot in enumerate(self.slots):
+            if self._searched(slot):
+                self._move(i)
+
+    def invalidate(self):
+        """Drop the network outputs the searches kept for the previous
+        weights.
+        """
+        for slot in self.slots:
+            slot.player.invalidate()
+
+    def next_game(self):
+        """Run the pool until a game is finished.
+
+        # Returns
+            states: ndarray, Input states for training.
+            move_probs: ndarray, output policy for training.
+            values: ndarray, output value for training.
+        """
+        while not self.finished:
+            self.step()
+
+        return self.finished.pop(0)
+
+    def stats(self):
+        """Get the throughput since start.
+
+        # Returns
+            Dict, positions played per second and mean network batch.
+        """
+        elapsed = max(time.time() - self.start_time, 1e-6)
+
+        return {'positions_per_sec': self.positions / elapsed,
+                'batch': self.leaves / max(self.batches, 1)}
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Centralised inference service for self-play workers.
+
+A single process owns the policy value network. Clients write their state
+tensors into a shared-memory slot and post a request; the server gathers the
+requests of many clients until the batch is full or a short deadline
+expires, runs one forward pass and writes (value, policy) back into the
+client slots.
+"""
+import time
+import queue as Q
+import multiprocessing as mp
+import numpy as np
+
+from .. import config as c
+
+
+def serve(requests, inputs, values, policies, events, metrics,
+          weights, version, max_batch, max_wait):
+    """Serve the inference requests forever.
+
+    # Arguments
+        requests: Queue, (client, number of states, sent time) requests.
+        inputs: List, shared input slot of every client.
+        values: List, shared value slot of every client.
+        policies: List, shared policy slot of every client.
+        events: List, Event set when the result of a client is ready.
+        metrics: Array, batches, positions, requests and queue latency.
+        weights: String, file of the published weights.
+        version: Value, version of the published weights.
+        max_batch: Integer, number of positions that fills a batch.
+        max_wait: Float, seconds to wait for a batch to fill.
+    """
+    # imported here so that only the server process builds a graph
+    from keras import backend as K
+    from ..model.model import PolicyValueNet
+
+    model = PolicyValueNet(c.DIM, c.K, c.FILTERS, c.KERNELS).get_model()
+    predict = K.function(model.inputs + [K.learning_phase()], model.outputs)
+    loaded = -1
+
+    n_slot = len(values[0])
+    inputs = [np.frombuffer(x, dtype=np.float32).reshape((n_slot,) + c.DIM)
+              for x in inputs]
+    values = [np.frombuffer(x, dtype=np.float32) for x in values]
+    policies = [np.frombuffer(x, dtype=np.float32).reshape(n_slot, -1)
+                for x in policies]
+
+    while True:
+        pending = [requests.get()]
+        size = pending[0][1]
+        deadline = time.time() + max_wait
+
+        while size < max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(requests.get(timeout=remaining))
+            except Q.Empty:
+                break
+            size += pending[-1][1]
+
+        if version.value != loaded:
+            loaded = version.value
+            model.load_weights(weights)
+
+        start = time.time()
+        states = np.concatenate([inputs[i][:n] for i, n, _ in pending])
+        value, policy = predict([states, 0])
+
+        offset = 0
+        for i, n, _ in pending:
+            values[i][:n] = value[offset:offset + n, 0]
+            policies[i][:n] = policy[offset:offset + n]
+            events[i].set()
+            offset += n
+
+        with metrics.get_lock():
+            metrics[0] += 1
+            metrics[1] += size
+            metrics[2] += len(pending)
+            metrics[3] += sum(start - t for _, _, t in pending)
+
+
+class InferenceClient(object):
+    """
+    Policy value network call served by an InferenceServer.
+    """
+
+    def __init__(self, index, requests, inputs, values, policies, event):
+        """Init.
+
+        # Arguments
+            index: Integer, slot of the client.
+            requests: Queue, request queue of the server.
+            inputs: RawArray, shared input slot.
+            values: RawArray, shared value slot.
+            policies: RawArray, shared policy slot.
+            event: Event, set by the server when the result is ready.
+        """
+        self.index = index
+        self.requests = requests
+        self.shared = (inputs, values, policies)
+        self.event = event
+        self.views = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['views'] = None
+
+        return state
+
+    def __call__(self, states):
+        """Evaluate a batch of states.
+
+        # Arguments
+            states: ndarray, batch of states for network input.
+
+        # Returns
+            value: ndarray, value output.
+            policy: ndarray, policy output.
+        """
+        if self.views is None:
+            inputs, values, policies = self.shared
+            n_slot = len(values)
+            self.views = (
+                np.frombuffer(inputs, dtype=np.float32).reshape(
+                    (n_slot,) + c.DIM),
+                np.frombuffer(values, dtype=np.float32),
+                np.frombuffer(policies, dtype=np.float32).reshape(n_slot, -1))
+        inputs, values, policies = self.views
+
+        n_slot = len(values)
+        if len(states) > n_slot:
+            value, policy = zip(*[self(states[i:i + n_slot])
+                                  for i in range(0, len(states), n_slot)])
+            return np.concatenate(value), np.concatenate(policy)
+
+        n = len(states)
+        inputs[:n] = states
+        self.event.clear()
+        self.requests.put((self.index, n, time.time()))
+        self.event.wait()
+
+        return values[:n].reshape(n, 1).copy(), policies[:n].copy()
+
+
+class InferenceServer(object):
+    """
+    Inference process shared by many clients.
+    """
+
+    def __init__(self, clients, weights, version, max_batch=c.SERVER_BATCH,
+                 max_wait=c.SERVER_WAIT, slot=c.BATCH_MCTS):
+        """Init.
+
+        # Arguments
+            clients: Integer, number of clients.
+            weights: String, file of the published weights.
+            version: Value, version of the published weights, the server
+                reloads them when it changes.
+            max_batch: Integer, number of positions that fills a batch.
+            max_wait: Float, seconds to wait for a batch to fill.
+            slot: Integer, max number of states per client request.
+        """
+        self.context = mp.get_context('spawn')
+        self.weights = weights
+        self.version = version
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        n_input = slot * int(np.prod(c.DIM))
+        n_policy = slot * c.DIM[1] * c.DIM[2]
+        self.requests = self.context.Queue()
+        self.inputs = [self.context.RawArray('f', n_input)
+                       for _ in range(clients)]
+        self.values = [self.context.RawArray('f', slot)
+                       for _ in range(clients)]
+        self.policies = [self.context.RawArray('f', n_policy)
+                         for _ in range(clients)]
+        self.events = [self.context.Event() for _ in range(clients)]
+        self.metrics = self.context.Array('d', 4)
+        self.process = None
+
+    def client(self, index):
+        """Get the network call of a client.
+
+        # Arguments
+            index: Integer, slot of the client.
+
+        # Returns
+            InferenceClient, callable as a MCTS policy_value_fn.
+        """
+        return InferenceClient(index, self.requests, self.inputs[index],
+                               self.values[index], self.policies[index],
+                               self.events[index])
+
+    def start(self):
+        """Start the server process.
+        """
+        self.process = self.context.Process(
+            target=serve,
+            args=(self.requests, self.inputs, self.values, self.policies,
+                  self.events, self.metrics, self.weights, self.version,
+                  self.max_batch, self.max_wait))
+        self.process.daemon = True
+        self.process.start()
+
+    def stats(self):
+        """Get the batching metrics.
+
+        # Returns
+            Dict, average positions per batch, batch fill ratio and average
+            queue latency of a request in milliseconds.
+        """
+        with self.metrics.get_lock():
+            batches, positions, requests, latency = self.metrics[:]
+
+        batch = positions / max(batches, 1)
+
+        return {'batch': batch,
+                'fill': batch / self.max_batch,
+                'latency_ms': 1000.0 * latency / max(requests, 1)}
+
+    def stop(self):
+        """Stop the server process.
+        """
+        if self.process:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
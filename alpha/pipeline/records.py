@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Compact self-play game records.
+
+A game is stored as its moves, the visit counts of the searched moves at
+every turn and the result, instead of the dense training tensors. Games are
+appended to chunked binary files and turned back into (states, probs,
+values) by a vectorized loader, so archived games can be trained on again.
+
+Every chunk file starts with a magic number and the board size, followed by
+the games, each one being:
+
+    header      moves, visit entries, winner, start player
+    moves       uint16 per move
+    counts      uint16 per move, number of visit entries of the turn
+    actions     uint16 per visit entry
+    visits      uint32 per visit entry
+"""
+import os
+import glob
+import numpy as np
+
+from .. import config as c
+
+
+MAGIC = b'AZG1'
+HEADER = np.dtype([('moves', '<u2'), ('entries', '<u4'),
+                   ('winner', 'u1'), ('start', 'u1')])
+
+
+class RecordWriter(object):
+    """
+    Append-only writer of game records.
+    """
+
+    def __init__(self, path=c.RECORD_PATH, games_per_chunk=c.RECORD_CHUNK,
+                 size=c.SIZE):
+        """Init.
+
+        # Arguments
+            path: String, prefix of the chunk files.
+            games_per_chunk: Integer, games written to a file before the
+                next one is started.
+            size: tuple, height and width of checkerboard.
+        """
+        self.path = path
+        self.games_per_chunk = games_per_chunk
+        self.size = size
+        # a new run never appends to the chunks of a previous one
+        self.chunk = len(glob.glob(path + '_*.bin'))
+        self.games = 0
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def _file(self):
+        return '{0}_{1:05d}.bin'.format(self.path, self.chunk)
+
+    def write(self, moves, visits, winner, start_player):
+        """Append a game.
+
+        # Arguments
+            moves: List, moves of the game.
+            visits: List, (actions, visit counts) of the search of every
+                move.
+            winner: Integer, winner of the game, 0 for a draw.
+            start_player: Integer, player of the first move.
+        """
+        if self.games == self.games_per_chunk:
+            self.chunk += 1
+            self.games = 0
+
+        actions = [np.asarray(a) for a, _ in visits]
+        counts = [np.asarray(n) for _, n in visits]
+        # unvisited moves get no probability, they are not stored, unless
+        # no move was visited: a single candidate is played without
+        # simulations and its policy is uniform over the unvisited moves
+        keep = [n > 0 if np.any(n > 0) else np.ones(len(n), dtype=bool)
+                for n in counts]
+        actions = np.concatenate([a[k] for a, k in zip(actions, keep)])
+        counts = np.concatenate([n[k] for n, k in zip(counts, keep)])
+        entries = np.array([k.sum() for k in keep])
+
+        header = np.array([(len(moves), len(actions), winner, start_player)],
+                          dtype=HEADER)
+
+        path = self._file()
+        with open(path, 'ab') as f:
+            if not self.games and f.tell() == 0:
+                f.write(MAGIC)
+                f.write(np.array(self.size, dtype='<u2').tobytes())
+            f.write(header.tobytes())
+            f.write(np.asarray(moves, dtype='<u2').tobytes())
+            f.write(entries.astype('<u2').tobytes())
+            f.write(actions.astype('<u2').tobytes())
+            f.write(counts.astype('<u4').tobytes())
+        self.games += 1
+
+
+def read_records(pattern=c.RECORD_PATH + '*.bin', size=c.SIZE):
+    """Read the games of record files, oldest first.
+
+    A chunk is appended to in time order, chunks are ordered by their last
+    write since the file names of different writers and runs are not.
+
+    # Arguments
+        pattern: String, glob pattern of the chunk files.
+        size: tuple, height and width of checkerboard the games must have.
+
+    # Returns
+        games: List, (moves, entries, actions, visits, winner, start
+            player) of every game.
+    """
+    games = []
+
+    paths = sorted(glob.glob(pattern),
+                   key=lambda path: (os.path.getmtime(path), path))
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            raise Exception('%s is not a game record file' % path)
+        if tuple(np.frombuffer(data, '<u2', 2, 4)) != tuple(size):
+            raise Exception('%s has another board size' % path)
+
+        offset = 8
+        while offset + HEADER.itemsize <= len(data):
+            header = np.frombuffer(data, HEADER, 1, offset)[0]
+            n, m = int(header['moves']), int(header['entries'])
+            end = offset + HEADER.itemsize + 4 * n + 6 * m
+            if end > len(data):
+                # torn write of an interrupted run
+                break
+
+            offset += HEADER.itemsize
+            moves = np.frombuffer(data, '<u2', n, offset)
+            entries = np.frombuffer(data, '<u2', n, offset + 2 * n)
+            actions = np.frombuffer(data, '<u2', m, offset + 4 * n)
+            visits = np.frombuffer(data, '<u4', m, offset + 4 * n + 2 * m)
+            games.append((moves, entries, actions, visits,
+                          int(header['winner']), int(header['start'])))
+            offset = end
+
+    return games
+
+
+def to_tensors(games, size=c.SIZE, step=c.STEP, dtype=np.uint8):
+    """Rebuild the training tensors of games.
+
+    A position before move t is encoded like `Board.get_current_states`:
+    plane 2j + i holds the pieces played at a time s <= t - 2 - 2j + i with
+    the parity of that bound, i.e. the pieces of the player to move (i = 0)
+    or of the opponent (i = 1) as they were 2j moves earlier. All the planes
+    of all the positions are computed at once from the time every position
+    of the board was played.
+
+    # Arguments
+        games: List, games from `read_records`.
+        size: tuple, height and width of checkerboard.
+        step: Integer, history length of the states.
+        dtype: dtype of the states.
+
+    # Returns
+        states: ndarray, states for network input.
+        probs: ndarray, policy output.
+        values: ndarray, value output.
+    """
+    cells = size[0] * size[1]
+    lengths = np.array([len(g[0]) for g in games])
+    n = int(lengths.sum())
+
+    # time every position was played, past the end of the game if never
+    times = np.full((len(games), cells), np.iinfo(np.int32).max // 2,
+                    dtype=np.int32)
+    for i, game in enumerate(games):
+        times[i, game[0]] = np.arange(len(game[0]))
+    times = np.repeat(times, lengths, axis=0)
+
+    # move number of every position
+    t = np.arange(n) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    k = np.arange(2 * step)
+    bounds = t[:, None] - 2 - 2 * (k // 2) + k % 2
+    played = times[:, None, :] <= bounds[:, :, None]
+    parity = (times[:, None, :] - bounds[:, :, None]) % 2 == 0
+
+    states = np.zeros((n, 2 * step + 1, cells), dtype=dtype)
+    states[:, :2 * step] = played & parity
+    states[:, 2 * step] = (t % 2 == 0)[:, None]
+    states = states.reshape((n, 2 * step + 1) + tuple(size))
+
+    # policies of the visit counts, as in MCTS.get_move_probs
+    entries = np.concatenate([g[1] for g in games]).astype(np.int64)
+    actions = np.concatenate([g[2] for g in games]).astype(np.int64)
+    visits = np.concatenate([g[3] for g in games]).astype(np.float64)
+    probs = np.zeros((n, cells), dtype=np.float32)
+
+    # reduceat needs non-empty segments, the entries of a turn are
+    # contiguous so the empty ones are just left out
+    full = entries > 0
+    if full.any():
+        starts = (np.cumsum(entries) - entries)[full]
+        x = 1e3 * np.log(visits + 1e-10)
+        x -= np.repeat(np.maximum.reduceat(x, starts), entries[full])
+        x = np.exp(x)
+        x /= np.repeat(np.add.reduceat(x, starts), entries[full])
+        probs[np.repeat(np.arange(n), entries), actions] = x
+
+    # turns without entries, from earlier writers that dropped unvisited
+    # moves only, get the played move
+    moves = np.concatenate([g[0] for g in games]).astype(np.int64)
+    probs[~full, moves[~full]] = 1
+
+    # result from the view of the player of every move
+    values = []
+    for game, length in zip(games, lengths):
+        winner, start = game[4], game[5]
+        if winner:
+            mover = np.where(np.arange(length) % 2 == 0, start, 3 - start)
+            values.append(np.where(mover == winner, 1.0, -1.0))
+        else:
+            values.append(np.zeros(length))
+    values = np.concatenate(values) if values else np.zeros(0)
+
+    return states, probs, values
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Replay buffer of self-play training samples.
+"""
+import os
+import numpy as np
+
+from .. import config as c
+from ..game import symmetry
+
+
+class ReplayBuffer(object):
+    """
+    Fixed-capacity ring buffer of (state, policy, value) samples.
+
+    Samples live in preallocated arrays and the oldest ones are overwritten
+    once the buffer is full. The buffer can be snapshotted to memory-mapped
+    files and loaded back when a run is restarted.
+    """
+
+    def __init__(self, capacity=c.REPLAY_CAPACITY, path=c.REPLAY_PATH):
+        """Init.
+
+        # Arguments
+            capacity: Integer, max number of samples.
+            path: String, prefix of the snapshot files.
+        """
+        self.capacity = capacity
+        self.path = path
+        # 0/1 planes, converted to float32 when fed to the network
+        self.states = np.zeros((capacity,) + c.DIM, dtype=np.uint8)
+        self.probs = np.zeros((capacity, c.DIM[1] * c.DIM[2]),
+                              dtype=np.float32)
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.index = 0  # next position to write
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, states, probs, values):
+        """Add the samples of a game.
+
+        # Arguments
+            states: ndarray, states for network input.
+            probs: ndarray, policy output.
+            values: ndarray, value output.
+        """
+        n = min(len(states), self.capacity)
+        index = (self.index + np.arange(n)) % self.capacity
+
+        self.states[index] = states[-n:]
+        self.probs[index] = probs[-n:]
+        self.values[index] = values[-n:]
+
+        self.index = (self.index + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample(self, n=c.REPLAY_SAMPLE, augment=False):
+        """Sample a uniform minibatch.
+
+        # Arguments
+            n: Integer, number of samples.
+            augment: Boolean, apply a random symmetry to every sample
+                instead of storing all the symmetries in the buffer.
+
+        # Returns
+            states: ndarray, states for network input.
+            values: ndarray, value output.
+            probs: ndarray, policy output.
+        """
+        index = np.random.randint(0, self.size, n)
+        states, probs = self.states[index], self.probs[index]
+
+        if augment:
+            symmetry.random_symmetry(states, probs)
+
+        return states, self.values[index], probs
+
+    def _files(self):
+        """Get the snapshot file of every array.
+        """
+        return {name: '{0}_{1}.npy'.format(self.path, name)
+                for name in ['states', 'probs', 'values', 'meta']}
+
+    def save(self):
+        """Snapshot the buffer to its memory-mapped files.
+        """
+        files = self._files()
+
+        for name in ['states', 'probs', 'values']:
+            array = getattr(self, name)
+            m = None
+            if os.path.exists(files[name]):
+                m = np.lib.format.open_memmap(files[name], mode='r+')
+            if m is None or m.shape != array.shape or m.dtype != array.dtype:
+                m = np.lib.format.open_memmap(files[name], mode='w+',
+                                              dtype=array.dtype,
+                                              shape=array.shape)
+            m[:self.size] = array[:self.size]
+            m.flush()
+            del m
+
+        # the meta data is written last, an interrupted snapshot keeps the
+        # previous sizes
+        temp = files['meta'] + '.tmp.npy'
+        np.save(temp, np.array([self.index, self.size, self.capacity]))
+        os.replace(temp, files['meta'])
+
+    def load(self):
+        """Load the last snapshot if there is one.
+
+        # Returns
+            Boolean, if a snapshot was loaded.
+        """
+        files = self._files()
+        if not os.path.exists(files['meta']):
+            return False
+
+        index, size, capacity = np.load(files['meta'])
+        if capacity != self.capacity:
+            raise Exception('Replay snapshot capacity %d does not match %d'
+                            % (capacity, self.capacity))
+
+        for name in ['states', 'probs', 'values']:
+            m = np.load(files[name], mmap_mode='r')
+            getattr(self, name)[:size] = m[:size]
+            del m
+
+        self.index, self.size = int(index), int(size)
+
+        return True
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming training decoupled from self-play.
+
+A feeder thread adds every finished self-play game to the replay buffer while
+a prefetch thread keeps a few sampled minibatches ready, so the training
+steps of the main thread overlap with game generation and batch sampling.
+Training is counted in steps instead of epochs per game.
+"""
+import time
+import queue as Q
+import threading
+
+from .. import config as c
+from ..game import symmetry
+
+
+class StreamingTrainer(object):
+    """
+    Trains a player on minibatches streamed from self-play output.
+    """
+
+    def __init__(self, player, buffer, games, batch=c.BATCH,
+                 prefetch=c.PREFETCH, min_positions=c.MIN_POSITIONS,
+                 ratio=c.TRAIN_RATIO, augment=c.AUGMENT):
+        """Init.
+
+        # Arguments
+            player: AlphaZeroPlayer, player whose network is trained.
+            buffer: ReplayBuffer, buffer the games are added to.
+            games: function, returns the next self-play game as
+                (states, probs, values), called from the feeder thread.
+            batch: Integer, samples per training step.
+            prefetch: Integer, minibatches sampled ahead of the step.
+            min_positions: Integer, samples in the buffer before training
+                starts.
+            ratio: Float, max training steps per generated position, the
+                steps wait for self-play when they get ahead, 0 for no
+                limit.
+            augment: Integer, 0 none, 1 store all 8 symmetries, 2 random
+                symmetry at sampling.
+        """
+        self.player = player
+        self.buffer = buffer
+        self.games = games
+        self.batch = batch
+        self.min_positions = min_positions
+        self.ratio = ratio
+        self.augment = augment
+
+        self.lock = threading.Lock()    # guards the buffer
+        self.batches = Q.Queue(maxsize=prefetch)
+        self.halt = threading.Event()
+        self.threads = []
+        self.error = None
+
+        self.played = 0     # games added to the buffer
+        self.positions = 0  # positions generated, before augmentation
+        self.steps = 0
+        self.samples = 0
+        self.wait = 0.0     # seconds the steps waited for data
+        self.start_time = None
+
+    def _run(self, loop):
+        """Thread body, keeps the error for the training thread.
+        """
+        try:
+            while not self.halt.is_set():
+                loop()
+        except Exception as e:
+            self.error = e
+            self.halt.set()
+
+    def _feed(self):
+        """Add the next self-play game to the buffer.
+        """
+        states, probs, values = self.games()
+        n = len(states)
+        if self.augment == 1:
+            states, probs, values = symmetry.augment(states, probs, values)
+
+        with self.lock:
+            if self.halt.is_set():
+                return
+            self.buffer.add(states, probs, values)
+            self.played += 1
+            self.positions += n
+
+    def _prefetch(self):
+        """Sample the next minibatch once the buffer is warm.
+        """
+        with self.lock:
+            ready = len(self.buffer) >= self.min_positions
+            if ready:
+                batch = self.buffer.sample(self.batch,
+                                           augment=self.augment == 2)
+        if not ready:
+            time.sleep(0.1)
+            return
+
+        while not self.halt.is_set():
+            try:
+                self.batches.put(batch, timeout=0.1)
+                return
+            except Q.Full:
+                pass
+
+    def start(self):
+        """Start the feeder and prefetch threads.
+        """
+        self.start_time = time.time()
+        for loop in [self._feed, self._prefetch]:
+            thread = threading.Thread(target=self._run, args=(loop,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def step(self):
+        """Run one training step on the next prefetched minibatch.
+
+        # Returns
+            loss: List, total, value and policy loss of the step.
+        """
+        start = time.time()
+        while True:
+            if self.error is not None:
+                raise self.error
+            if self.ratio and self.steps >= self.ratio * self.positions:
+                time.sleep(0.01)
+                continue
+            try:
+                states, values, probs = self.batches.get(timeout=0.1)
+                break
+            except Q.Empty:
+                pass
+        self.wait += time.time() - start
+
+        loss = self.player.train_step(states, values, probs)
+        self.steps += 1
+        self.samples += len(states)
+
+        return loss
+
+    def stats(self):
+        """Get the throughput since start.
+
+        # Returns
+            Dict, trained samples per second, training steps per generated
+            position, generated positions per second and the share of time
+            the steps waited for data.
+        """
+        elapsed = max(time.time() - self.start_time, 1e-6)
+
+        return {'samples_per_sec': self.samples / elapsed,
+                'steps_per_position': self.steps / max(self.positions, 1),
+                'positions_per_sec': self.positions / elapsed,
+                'wait': self.wait / elapsed}
+
+    def report(self):
+        """Get a one line summary of the throughput.
+
+        # Returns
+            String, summary of `stats`.
+        """
+        stats = self.stats()
+
+        return ("{0} games, {1:.0f} samples/s, {2:.2f} steps/position, "
+                "{3:.1f} positions/s, {4:.0%} waiting").format(
+                    self.played, stats['samples_per_sec'],
+                    stats['steps_per_position'], stats['positions_per_sec'],
+                    stats['wait'])
+
+    def save(self):
+        """Snapshot the replay buffer between two additions.
+        """
+        with self.lock:
+            self.buffer.save()
+
+    def stop(self):
+        """Stop the threads, the game in progress is dropped.
+        """
+        with self.lock:
+            self.halt.set()
+        # the feeder may be blocked in a game, it exits after it
+        self.threads[1].join()
+        self.threads = []
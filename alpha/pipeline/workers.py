@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel self-play with a pool of worker processes.
+
+Every worker owns a player built from the latest published weights, plays
+games on its own and streams the finished (states, probs, values) back to
+the trainer through a queue.
+"""
+import os
+import time
+import multiprocessing as mp
+
+from .. import config as c
+from .inference import InferenceServer
+
+
+def self_play_worker(queue, version, weights, client=None, record=None):
+    """Play self-play games forever.
+
+    # Arguments
+        queue: Queue, finished games are put into it.
+        version: Value, version of the published weights.
+        weights: String, file of the published weights.
+        client: InferenceClient, network call served by the inference
+            server, the worker builds its own model if None.
+        record: String, prefix of the game record files of the worker,
+            None keeps no records.
+    """
+    # imported here so that every process builds its own graph
+    from ..game.game import Game
+    from ..model.player import AlphaZeroPlayer
+    from .records import RecordWriter
+
+    player = AlphaZeroPlayer(selfplay=1, init=1, evaluator=client)
+    game = Game(c.SIZE, c.PIECE, 1)
+    writer = RecordWriter(record) if record else None
+    loaded = -1
+
+    while True:
+        if version.value != loaded:
+            loaded = version.value
+            if client is None:
+                player.load_weights(weights)
+            else:
+                # the server loads the weights, the search still keeps
+                # outputs of the previous ones
+                player.mcts.clear_tt()
+
+        states, move_probs, values = game.self_play(player, writer)
+        queue.put((states, move_probs, values))
+
+
+class SelfPlayPool(object):
+    """
+    Pool of self-play worker processes.
+    """
+
+    def __init__(self, workers, weights='alpha/data/selfplay.h5',
+                 server=c.INFERENCE_SERVER):
+        """Init.
+
+        # Arguments
+            workers: Integer, number of worker processes.
+            weights: String, file used to publish the weights to workers.
+            server: Boolean, evaluate the positions of all workers in one
+                inference server process instead of one model per worker.
+        """
+        # spawn, a forked Keras session is not usable in the child
+        self.context = mp.get_context('spawn')
+        self.workers = workers
+        self.weights = weights
+        self.queue = self.context.Queue(maxsize=2 * workers)
+        self.version = self.context.Value('i', -1)
+        self.processes = []
+        self.server = None
+        if server:
+            self.server = InferenceServer(workers, weights, self.version)
+
+        self.games = 0
+        self.positions = 0
+        self.start_time = None
+
+    def publish(self, model):
+        """Publish the weights of the model to the workers.
+        Workers pick them up before their next game.
+
+        # Arguments
+            model: Model, trained policy value network.
+        """
+        temp = self.weights + '.tmp.h5'
+        model.save_weights(temp)
+        os.replace(temp, self.weights)
+
+        with self.version.get_lock():
+            self.version.value += 1
+
+    def start(self, model):
+        """Publish the initial weights and start the workers.
+
+        # Arguments
+            model: Model, policy value network to play with.
+        """
+        self.publish(model)
+        self.start_time = time.time()
+
+        if self.server:
+            self.server.start()
+
+        for i in range(self.workers):
+            client = self.server.client(i) if self.server else None
+            record = '{0}-w{1}'.format(c.RECORD_PATH, i) if c.RECORD else None
+            p = self.context.Process(target=self_play_worker,
+                                     args=(self.queue, self.version,
+                                           self.weights, client, record))
+            p.daemon = True
+            p.start()
+            self.processes.append(p)
+
+    def get(self, timeout=None):
+        """Get the next finished game.
+
+        # Arguments
+            timeout: Float, seconds to wait, None waits forever.
+
+        # Returns
+            states: ndarray, Input states for training.
+            move_probs: ndarray, output policy for training.
+            values: ndarray, output value for training.
+        """
+        states, move_probs, values = self.queue.get(timeout=timeout)
+        self.games += 1
+        self.positions += len(states)
+
+        return states, move_probs, values
+
+    def games_per_hour(self):
+        """Get the self-play throughput since start.
+
+        # Returns
+            Float, games per hour.
+        """
+        return self.games * 3600.0 / max(time.time() - self.start_time, 1e-6)
+
+    def report(self):
+        """Get a one line summary of the self-play throughput.
+
+        # Returns
+            String, games per hour and inference server metrics.
+        """
+        text = "{0:.1f} games/hour".format(self.games_per_hour())
+
+        if self.server:
+            stats = self.server.stats()
+            text += ", batch {0:.1f} ({1:.0%} full), latency {2:.2f} ms".format(
+                stats['batch'], stats['fill'], stats['latency_ms'])
+
+        return text
+
+    def stop(self):
+        """Stop all the workers.
+        """
+        for p in self.processes:
+            p.terminate()
+        for p in self.processes:
+            p.join()
+        self.processes = []
+
+        if self.server:
+            self.server.stop()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation of the self-play hot paths.
+
+Set `PROFILE = 1` in config or the environment variable `ALPHA_PROFILE=1`
+before the modules are imported to record the cumulative time and call
+count of every instrumented phase. `ALPHA_PROFILE=cprofile` also runs
+cProfile over every game. When disabled the `phase` decorator returns the
+function itself, so the instrumented code runs unchanged.
+"""
+import os
+import time
+import cProfile
+import threading
+import contextlib
+from functools import wraps
+
+from . import config as c
+
+
+MODE = os.environ.get('ALPHA_PROFILE', str(c.PROFILE))
+ENABLED = MODE not in ['', '0']
+
+_totals = {}    # phase -> [seconds, calls]
+_stacks = {}    # call stack -> self seconds
+_local = threading.local()  # per thread [phase, start, seconds in children]
+_lock = threading.Lock()    # guards the totals and the stacks
+_games = [0]
+
+
+def _frames():
+    """Get the open phases of the calling thread.
+    """
+    if not hasattr(_local, 'frames'):
+        _local.frames = []
+
+    return _local.frames
+
+
+def phase(name):
+    """Decorator recording the time spent in a function.
+
+    # Arguments
+        name: String, name of the phase.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            frames = _frames()
+            frame = [name, time.perf_counter(), 0.0]
+            frames.append(frame)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - frame[1]
+                stack = tuple(f[0] for f in frames)
+                frames.pop()
+                if frames:
+                    frames[-1][2] += elapsed
+
+                with _lock:
+                    total = _totals.setdefault(name, [0.0, 0])
+                    total[0] += elapsed
+                    total[1] += 1
+                    _stacks[stack] = _stacks.get(stack, 0.0) + \
+                        elapsed - frame[2]
+
+        return wrapper
+
+    return decorator
+
+
+def summary():
+    """Get the recorded phases as a table.
+
+    # Returns
+        String, total time, calls and time per call of every phase.
+    """
+    lines = ['{0:<28}{1:>10}{2:>10}{3:>12}'.format(
+        'phase', 'total s', 'calls', 'us/call')]
+
+    with _lock:
+        totals = list(_totals.items())
+    for name, (seconds, calls) in sorted(totals,
+                                         key=lambda x: -x[1][0]):
+        lines.append('{0:<28}{1:>10.3f}{2:>10d}{3:>12.1f}'.format(
+            name, seconds, calls, 1e6 * seconds / calls))
+
+    return '\n'.join(lines)
+
+
+def dump_stacks(path):
+    """Append the recorded call stacks in the folded format of flamegraph.pl
+    and speedscope, one `phase;phase;phase microseconds` line per stack.
+
+    # Arguments
+        path: String, stack file.
+    """
+    with _lock:
+        stacks = sorted(_stacks.items())
+    with open(path, 'a') as f:
+        for stack, seconds in stacks:
+            f.write('{0} {1}\n'.format(';'.join(stack), int(1e6 * seconds)))
+
+
+def reset():
+    """Clear the recorded phases.
+    """
+    with _lock:
+        _totals.clear()
+        _stacks.clear()
+
+
+@contextlib.contextmanager
+def game(path=c.PROFILE_PATH):
+    """Profile one self-play game.
+    Prints the summary of the game, appends its stacks to `path.folded` and,
+    in cprofile mode, dumps the cProfile stats to `path_<game>.prof`.
+
+    # Arguments
+        path: String, prefix of the profile files.
+    """
+    if not ENABLED:
+        yield
+        return
+
+    profile = cProfile.Profile() if MODE == 'cprofile' else None
+    if profile:
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats('{0}_{1}.prof'.format(path, _games[0]))
+
+        _games[0] += 1
+        print('Profile of game {0}'.format(_games[0]))
+        print(summary())
+        dump_stacks(path + '.folded')
+        reset()
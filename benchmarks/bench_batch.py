@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Nodes per second of MCTS with batched leaf evaluation and virtual loss.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_batch
+    python -m benchmarks.bench_batch --keras
+
+The exported NumPy network is used, or a random network of the same shape
+without an export, so the benchmark runs without Keras like the suite of
+benchmarks/run.py. `--keras` times the Keras network instead.
+"""
+import os
+import time
+import argparse
+import numpy as np
+
+import alpha.config as c
+from alpha.game.board import Board
+from alpha.model.engine import NumpyEngine
+from alpha.model.policy_mcts import MCTS as PolicyMCTS
+from benchmarks.run import _random_engine
+
+
+def bench_batch(policy_value_fn, batch, moves=5):
+    """Search the first moves of a game with a given leaf batch size.
+
+    # Arguments
+        policy_value_fn: function, policy value network call.
+        batch: Integer, max number of leaves per network call.
+        moves: Integer, number of moves searched.
+
+    # Returns
+        nodes: Float, simulations per second.
+        fill: Float, average number of leaves per network call.
+    """
+    calls = []
+
+    def counted(states):
+        calls.append(len(states))
+        return policy_value_fn(states)
+
+    np.random.seed(0)
+    board = Board(c.SIZE, c.PIECE, 1)
+    mcts = PolicyMCTS(counted, c.c_puct, c.N_SIMULATE, c.COPY_FREE,
+                      batch, c.VIRTUAL_LOSS, early_stop=0)
+
+    start = time.time()
+    for _ in range(moves):
+        acts, probs = mcts.get_move_probs(board)
+        move = acts[int(np.argmax(probs))]
+        mcts.update_with_move(move)
+        board.move(move)
+        board.change_player()
+
+    return moves * c.N_SIMULATE / (time.time() - start), np.mean(calls)
+
+
+def network(keras=False):
+    """Get the policy value network call to search with.
+
+    # Arguments
+        keras: Boolean, use the Keras network instead of the NumPy engine.
+
+    # Returns
+        Function, network call on a batch of states.
+    """
+    if keras:
+        from alpha.model.player import AlphaZeroPlayer
+
+        player = AlphaZeroPlayer(init=1)
+        # warm up the graph before timing
+        player._get_value_policy(np.zeros((32,) + c.DIM))
+        return player._get_value_policy
+
+    if os.path.exists(c.ENGINE_PATH):
+        return NumpyEngine(c.ENGINE_PATH)
+    return _random_engine()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--keras', action='store_true',
+                        help='time the Keras network')
+    args = parser.parse_args()
+
+    policy_value_fn = network(args.keras)
+    for batch in [1, 8, 16, 32]:
+        nodes, fill = bench_batch(policy_value_fn, batch)
+        print("batch {0:2d}: {1:7.0f} nodes/s, {2:5.1f} leaves per call".format(
+            batch, nodes, fill))
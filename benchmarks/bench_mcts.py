@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of MCTS simulations per second with and without board copies.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_mcts
+"""
+import copy
+import time
+import numpy as np
+
+import alpha.config as c
+from alpha.game.board import Board
+from alpha.model.policy_mcts import MCTS as PolicyMCTS
+
+
+def uniform_policy_value(states):
+    """Stand-in for the network: zero value and uniform policy.
+
+    # Arguments
+        states: ndarray, batch of states.
+
+    # Returns
+        values, policies: ndarray.
+    """
+    n, _, height, width = states.shape
+
+    return np.zeros((n, 1)), np.ones((n, height * width)) / (height * width)
+
+
+def bench_restore(copy_free, depth=6, n=20000):
+    """Play and restore a short line on a midgame board, without any search.
+
+    # Arguments
+        copy_free: Boolean, rewind the board instead of deep copying it.
+        depth: Integer, number of moves played per simulation.
+        n: Integer, number of simulations.
+
+    # Returns
+        Float, simulations per second.
+    """
+    np.random.seed(0)
+    board = Board(c.SIZE, c.PIECE, 1)
+    for move in np.random.choice(board.get_availables(), 20, replace=False):
+        board.move(move)
+        board.change_player()
+    line = np.random.choice(board.get_availables(), depth, replace=False)
+
+    start = time.time()
+    for _ in range(n):
+        b = board if copy_free else copy.deepcopy(board)
+        for move in line:
+            b.move(move)
+            b.get_game_status()
+            b.change_player()
+        if copy_free:
+            for _ in range(depth):
+                b.change_player()
+                b.unmove()
+
+    return n / (time.time() - start)
+
+
+def bench_simulations(copy_free, n_simulate=c.N_SIMULATE, moves=20):
+    """Run a full search per move on a 9x9 game with a uniform policy.
+
+    # Arguments
+        copy_free: Boolean, rewind the board instead of deep copying it.
+        n_simulate: Integer, simulate times per move.
+        moves: Integer, number of moves searched.
+
+    # Returns
+        Float, simulations per second.
+    """
+    np.random.seed(0)
+    board = Board(c.SIZE, c.PIECE, 1)
+    mcts = PolicyMCTS(uniform_policy_value, c.c_puct, n_simulate, copy_free,
+                      early_stop=0)
+
+    start = time.time()
+    for _ in range(moves):
+        acts, probs = mcts.get_move_probs(board)
+
+        move = acts[int(np.argmax(probs))]
+        mcts.update_with_move(move)
+        board.move(move)
+        board.change_player()
+
+    return moves * n_simulate / (time.time() - start)
+
+
+if __name__ == '__main__':
+    for name, bench in [('board only', bench_restore),
+                        ('full search', bench_simulations)]:
+        before = bench(copy_free=0)
+        after = bench(copy_free=1)
+        print("{0}:".format(name))
+        print("  deepcopy per simulation: {0:.0f} simulations/s".format(before))
+        print("  make/unmake on board:    {0:.0f} simulations/s".format(after))
+        print("  speedup: {0:.2f}x".format(after / before))
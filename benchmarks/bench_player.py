@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Time per move of AlphaZeroPlayer when MCTS evaluates every leaf with the
+policy value network, comparing Keras predict() with the direct graph call.
+Both bypass the evaluation cache, so only the call overhead is compared.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_player
+"""
+import time
+import numpy as np
+
+import alpha.config as c
+from alpha.game.board import Board
+from alpha.model.player import AlphaZeroPlayer
+
+
+def bench_moves(player, moves=5):
+    """Play the first moves of a game with the given player.
+
+    # Arguments
+        player: AlphaZeroPlayer, player to benchmark.
+        moves: Integer, number of moves searched.
+
+    # Returns
+        Float, seconds per move.
+    """
+    np.random.seed(0)
+    player.reset_player()
+    board = Board(c.SIZE, c.PIECE, 1)
+
+    start = time.time()
+    for _ in range(moves):
+        move = player.get_action(board)
+        board.move(move)
+        board.change_player()
+
+    return (time.time() - start) / moves
+
+
+if __name__ == '__main__':
+    player = AlphaZeroPlayer(init=1)
+    # the search calls the network through the evaluation cache, the
+    # hits would be counted for the direct call only
+    direct = player._get_value_policy
+
+    # warm up the graph before timing
+    player._get_value_policy(np.zeros((1,) + c.DIM))
+    player.model.predict(np.zeros((1,) + c.DIM))
+
+    player.mcts.policy_value_fn = player.model.predict
+    slow = bench_moves(player)
+    player.mcts.policy_value_fn = direct
+    fast = bench_moves(player)
+
+    print("up to {0} simulations per move on {1}x{2}".format(
+        c.N_SIMULATE, c.SIZE[0], c.SIZE[1]))
+    print("  model.predict(): {0:.3f} s/move".format(slow))
+    print("  direct call:     {0:.3f} s/move".format(fast))
+    print("  speedup: {0:.2f}x".format(slow / fast))
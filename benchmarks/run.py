@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for board, search, network and self-play throughput.
+
+Run from the repository root, results are printed and optionally written as
+JSON so that runs can be diffed across commits:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --only board,encode,mcts
+
+Sections that need Keras are reported as skipped when it is not installed.
+"""
+import argparse
+import json
+import os
+import shutil
+import platform
+import tempfile
+import subprocess
+import time
+import numpy as np
+
+import alpha.config as c
+from alpha.game import symmetry
+from alpha.game.board import Board
+from alpha.model.array_mcts import ArrayMCTS
+from alpha.model.cache import EvaluationCache
+from alpha.model.engine import NumpyEngine
+from alpha.pipeline.gamepool import GamePool
+from alpha.pipeline.replay import ReplayBuffer
+from alpha.model.policy_mcts import MCTS as PolicyMCTS
+from benchmarks.bench_mcts import uniform_policy_value
+
+
+SECTIONS = ['board', 'encode', 'memory', 'mcts', 'transposition', 'cache',
+            'network', 'engine', 'selfplay', 'pool']
+
+
+def _midgame_board(moves=20):
+    """Get a board with random moves played.
+    """
+    np.random.seed(0)
+    board = Board(c.SIZE, c.PIECE, 1)
+    for move in np.random.choice(board.get_availables(), moves, replace=False):
+        board.move(move)
+        board.change_player()
+
+    return board
+
+
+def bench_board(games=200):
+    """Board.move + get_game_status on random playouts.
+
+    # Returns
+        Dict, ops per second.
+    """
+    np.random.seed(0)
+    moves = [np.random.permutation(c.SIZE[0] * c.SIZE[1]) for _ in range(games)]
+    n = 0
+
+    start = time.time()
+    for order in moves:
+        board = Board(c.SIZE, c.PIECE, 1)
+        for move in order:
+            board.move(move)
+            n += 1
+            if board.get_game_status()[0] != -1:
+                break
+            board.change_player()
+
+    return {'ops_per_sec': n / (time.time() - start)}
+
+
+def bench_encode(n=20000):
+    """Board.get_current_states on a midgame board.
+
+    # Returns
+        Dict, encodings per second, with a new array and into a batch slot.
+    """
+    board = _midgame_board()
+    out = np.zeros(c.DIM, dtype=np.float32)
+
+    start = time.time()
+    for _ in range(n):
+        board.get_current_states()
+    alloc = n / (time.time() - start)
+
+    start = time.time()
+    for _ in range(n):
+        board.get_current_states(out=out)
+    slot = n / (time.time() - start)
+
+    return {'encodings_per_sec': alloc, 'encodings_per_sec_out': slot}
+
+
+def bench_memory(moves=40):
+    """Bytes per stored position along the training pipeline, as stored now
+    and with the float64 encoder and float32 replay buffer used before.
+
+    # Returns
+        Dict, bytes per position of the self-play output, of the augmented
+        output per source position and of the replay buffer.
+    """
+    np.random.seed(0)
+    board = Board(c.SIZE, c.PIECE, 1)
+    states = []
+    for move in np.random.permutation(c.SIZE[0] * c.SIZE[1])[:moves]:
+        states.append(board.get_current_states())
+        board.move(move)
+        board.change_player()
+
+    n = len(states)
+    results = {}
+    for name, state, prob, replay in [('before', np.float64, np.float64,
+                                       np.float32),
+                                      ('after', np.uint8, np.float32,
+                                       np.uint8)]:
+        x = np.array(states, dtype=state)
+        probs = np.zeros((n, c.SIZE[0] * c.SIZE[1]), dtype=prob)
+        values = np.zeros(n)
+        augmented = symmetry.augment(x, probs, values)
+
+        buffer = ReplayBuffer(1000)
+        buffer.states = buffer.states.astype(replay)
+        per_sample = (buffer.states.nbytes + buffer.probs.nbytes +
+                      buffer.values.nbytes) / buffer.capacity
+
+        results[name] = {
+            'self_play': (x.nbytes + probs.nbytes + values.nbytes) / n,
+            'augmented': sum(a.nbytes for a in augmented) / n,
+            'replay': per_sample}
+
+    return results
+
+
+def bench_mcts(moves=5):
+    """MCTS.get_move_probs with a uniform stand-in for the network.
+
+    # Returns
+        Dict, simulations per second for each tree representation.
+    """
+    results = {}
+
+    for name, cls in [('node_tree', PolicyMCTS), ('array_tree', ArrayMCTS)]:
+        board = _midgame_board(0)
+        mcts = cls(uniform_policy_value, c.c_puct, c.N_SIMULATE,
+                   c.COPY_FREE, c.BATCH_MCTS, c.VIRTUAL_LOSS, early_stop=0)
+
+        start = time.time()
+        for _ in range(moves):
+            acts, probs = mcts.get_move_probs(board)
+            move = acts[int(np.argmax(probs))]
+            mcts.update_with_move(move)
+            board.move(move)
+            board.change_player()
+
+        results[name] = moves * c.N_SIMULATE / (time.time() - start)
+
+    return {'simulations_per_sec': results}
+
+
+def _linear_policy_value():
+    """Get a fixed random linear stand-in for the network.
+
+    A uniform policy keeps the tree too shallow for transpositions.
+    """
+    weights = np.random.RandomState(0).randn(int(np.prod(c.DIM)),
+                                              c.DIM[1] * c.DIM[2])
+
+    def linear_policy_value(states):
+        x = states.reshape(len(states), -1).dot(weights)
+        policies = np.exp(x - x.max(axis=1, keepdims=True))
+        policies /= policies.sum(axis=1, keepdims=True)
+        return np.tanh(0.1 * x[:, :1]), policies
+
+    return linear_policy_value
+
+
+def _play(mcts, moves):
+    """Play the first moves of a game with the most visited move.
+    """
+    board = _midgame_board(0)
+    for _ in range(moves):
+        acts, probs = mcts.get_move_probs(board)
+        move = acts[int(np.argmax(probs))]
+        mcts.update_with_move(move)
+        board.move(move)
+        board.change_player()
+
+
+def bench_transposition(moves=10):
+    """Transposition table hit rate over the first moves of a game.
+
+    # Returns
+        Dict, hits, misses and hit rate.
+    """
+    mcts = ArrayMCTS(_linear_policy_value(), c.c_puct, c.N_SIMULATE,
+                     c.COPY_FREE, c.BATCH_MCTS, c.VIRTUAL_LOSS,
+                     early_stop=0, tt_size=c.TT_SIZE or 50000)
+    _play(mcts, moves)
+
+    return {'hits': mcts.tt.hits, 'misses': mcts.tt.misses,
+            'hit_rate': mcts.tt.hit_rate()}
+
+
+def bench_cache(moves=10, games=2):
+    """Evaluation cache hit rate over the first moves of a few games, with
+    and without sharing the entries of symmetric positions. The search tree
+    already keeps the evaluations within a game, the cache pays off across
+    games and tree resets.
+
+    # Returns
+        Dict, hit rate and entries for each mode.
+    """
+    results = {}
+
+    for name, symmetric in [('plain', 0), ('symmetric', 1)]:
+        cache = EvaluationCache(_linear_policy_value(),
+                                c.EVAL_CACHE_MB or 64, symmetric)
+        mcts = ArrayMCTS(cache, c.c_puct, c.N_SIMULATE, c.COPY_FREE,
+                         c.BATCH_MCTS, c.VIRTUAL_LOSS, early_stop=0)
+        for _ in range(games):
+            mcts.update_with_move(-1)
+            _play(mcts, moves)
+        results[name] = {'hit_rate': cache.hit_rate(), 'entries': len(cache)}
+
+    return results
+
+
+def _inferences(evaluate, batches, seconds):
+    """Positions per second of a network call at several batch sizes.
+    """
+    results = {}
+
+    for batch in batches:
+        states = np.random.randint(0, 2, (batch,) + c.DIM).astype(np.float32)
+        evaluate(states)
+
+        n = 0
+        start = time.time()
+        while time.time() - start < seconds:
+            evaluate(states)
+            n += batch
+        results[str(batch)] = n / (time.time() - start)
+
+    return results
+
+
+def bench_network(batches=(1, 8, 32, 128), seconds=2.0):
+    """Direct network calls at several batch sizes.
+
+    # Returns
+        Dict, positions per second for each batch size.
+    """
+    from alpha.model.player import AlphaZeroPlayer
+
+    player = AlphaZeroPlayer(init=1)
+
+    return {'inferences_per_sec': _inferences(player._get_value_policy,
+                                              batches, seconds)}
+
+
+def bench_engine(batches=(1, 8, 32, 128), seconds=2.0):
+    """Exported NumPy network calls at several batch sizes.
+
+    # Returns
+        Dict, load time and positions per second for each batch size.
+    """
+    from alpha.model.engine import NumpyEngine
+
+    if not os.path.exists(c.ENGINE_PATH):
+        return {'skipped': 'no exported network, run export.py'}
+
+    start = time.time()
+    engine = NumpyEngine(c.ENGINE_PATH)
+    load = time.time() - start
+
+    return {'load_sec': load,
+            'inferences_per_sec': _inferences(engine, batches, seconds)}
+
+
+def bench_selfplay(games=1):
+    """Full self-play games with the configured search.
+
+    # Returns
+        Dict, games per hour and positions per second.
+    """
+    from alpha.game.game import Game
+    from alpha.model.player import AlphaZeroPlayer
+
+    player = AlphaZeroPlayer(selfplay=1, init=1)
+    game = Game(c.SIZE, c.PIECE, 1)
+    positions = 0
+
+    start = time.time()
+    for _ in range(games):
+        states, move_probs, values = game.self_play(player)
+        positions += len(states)
+    elapsed = time.time() - start
+
+    return {'games_per_hour': games * 3600.0 / elapsed,
+            'positions_per_sec': positions / elapsed}
+
+
+def _random_engine():
+    """Get a NumPy engine of the configured shape with random weights.
+    """
+    rng = np.random.RandomState(0)
+    weights = {}
+
+    def conv(name, size, channels, filters):
+        weights[name + '_w'] = rng.randn(size, size, channels, filters) * \
+            np.sqrt(2.0 / (size * size * channels))
+        weights[name + '_b'] = np.zeros(filters)
+
+    def dense(name, inputs, outputs):
+        weights[name + '_w'] = rng.randn(inputs, outputs) / np.sqrt(inputs)
+        weights[name + '_b'] = np.zeros(outputs)
+
+    cells = c.DIM[1] * c.DIM[2]
+    conv('stem', c.KERNELS[0], c.DIM[0], c.FILTERS)
+    for i in range(c.K):
+        conv('res%d_1' % i, c.KERNELS[0], c.FILTERS, 2 * c.FILTERS)
+        conv('res%d_2' % i, c.KERNELS[0], 2 * c.FILTERS, c.FILTERS)
+    conv('value', 1, c.FILTERS, 1)
+    dense('value_dense', cells, 20)
+    dense('value_output', 20, 1)
+    conv('policy', 1, c.FILTERS, 2)
+    dense('policy_output', 2 * cells, cells)
+
+    # the engine reads the whole file, a private folder is removed at once
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'engine.npz')
+        np.savez(path, **{k: w.astype(np.float32)
+                          for k, w in weights.items()})
+        return NumpyEngine(path)
+    finally:
+        shutil.rmtree(folder)
+
+
+def bench_pool(games=(1, 4, 16, 64), moves=4):
+    """Single-process game pool at several numbers of concurrent games.
+    The exported network is used if there is one, a random network of the
+    same shape otherwise. Every G plays `moves` moves per game on average.
+
+    # Returns
+        Dict, positions per second and mean network batch for each G.
+    """
+    if os.path.exists(c.ENGINE_PATH):
+        engine = NumpyEngine(c.ENGINE_PATH)
+    else:
+        engine = _random_engine()
+    results = {}
+
+    for g in games:
+        np.random.seed(0)
+        pool = GamePool(engine, g)
+        while pool.positions < moves * g:
+            pool.step()
+        results[str(g)] = pool.stats()
+
+    return results
+
+
+def _commit():
+    """Get the current git commit, if any.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sections, games=1):
+    """Run the benchmark sections.
+
+    # Arguments
+        sections: List, names of the sections to run.
+        games: Integer, number of self-play games.
+
+    # Returns
+        Dict, results with the commit and the config they were run with.
+    """
+    benches = {'board': bench_board,
+               'encode': bench_encode,
+               'memory': bench_memory,
+               'mcts': bench_mcts,
+               'transposition': bench_transposition,
+               'cache': bench_cache,
+               'network': bench_network,
+               'engine': bench_engine,
+               'selfplay': lambda: bench_selfplay(games),
+               'pool': bench_pool}
+
+    report = {'commit': _commit(),
+              'python': platform.python_version(),
+              'config': {'SIZE': c.SIZE, 'PIECE': c.PIECE, 'STEP': c.STEP,
+                         'N_SIMULATE': c.N_SIMULATE,
+                         'BATCH_MCTS': c.BATCH_MCTS,
+                         'COPY_FREE': c.COPY_FREE,
+                         'ARRAY_TREE': c.ARRAY_TREE,
+                         'TT_SIZE': c.TT_SIZE,
+                         'EVAL_CACHE_MB': c.EVAL_CACHE_MB,
+                         'POOL_GAMES': c.POOL_GAMES},
+              'results': {}}
+
+    for name in sections:
+        try:
+            result = benches[name]()
+        except ImportError as e:
+            result = {'skipped': str(e)}
+        report['results'][name] = result
+        print(name, json.dumps(result))
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--only', default=','.join(SECTIONS),
+                        help='comma separated sections: ' + ', '.join(SECTIONS))
+    parser.add_argument('--games', type=int, default=1,
+                        help='number of self-play games')
+    parser.add_argument('--output', help='JSON file for the results')
+    args = parser.parse_args()
+
+    report = run(args.only.split(','), args.games)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Export the trained PolicyValueNet for the NumPy inference engine.
+
+    python export.py
+
+Set `ENGINE = 1` in alpha/config.py to play with the exported network.
+"""
+import numpy as np
+
+from alpha import config as c
+from alpha.model.engine import NumpyEngine, export
+from alpha.model.model import PolicyValueNet
+
+
+if __name__ == '__main__':
+    model = PolicyValueNet(c.DIM, c.K, c.FILTERS, c.KERNELS).get_model()
+    model.load_weights('alpha/data/pvmodel.h5')
+    export(model, c.ENGINE_PATH)
+
+    states = np.random.randint(0, 2, (64,) + c.DIM).astype(np.float32)
+    value, policy = model.predict(states)
+    engine_value, engine_policy = NumpyEngine(c.ENGINE_PATH)(states)
+
+    print('Exported to {0}, max error value {1:.2e} policy {2:.2e}'.format(
+        c.ENGINE_PATH, np.abs(value - engine_value).max(),
+        np.abs(policy - engine_policy).max()))
@@ -136,7 +136,7 @@ def main():
     running = True
 
     game = Game(c.SIZE, c.PIECE, 1)
-    AIPlayer = AlphaZeroPlayer()
+    AIPlayer = AlphaZeroPlayer(engine=c.ENGINE)
     ManPlayer = HumanPlayer(grid)
 
     if c.FIRST:
@@ -145,7 +145,7 @@ def main():
         players = [ManPlayer, AIPlayer]
 
     if c.AI_V_AI:
-        AIPlayer2 = AlphaZeroPlayer()
+        AIPlayer2 = AlphaZeroPlayer(engine=c.ENGINE)
         players = [AIPlayer, AIPlayer2]
 
     turn = 0
@@ -169,6 +169,16 @@ def main():
 
         win, winner, movements = game.play(players, click)
 
+        if players[cp - 1].id == 'ai':
+            print("AI turn {0}: reused {1} visits, ran {2} simulations".format(
+                turn + 1, players[cp - 1].reused,
+                players[cp - 1].mcts.simulations))
+
+            # search on the human's time
+            nxt = players[game.board.get_current_player() - 1]
+            if c.PONDER and nxt.id == 'human':
+                players[cp - 1].start_pondering(game.board)
+
         turn += 1
 
         draw_background(screen, edge, grid)
@@ -179,6 +189,10 @@ def main():
             show_game_result(screen, edge, win, winner)
             running = False
 
+    for player in players:
+        if player.id == 'ai':
+            player.stop_pondering()
+
     pygame.quit()
 
 
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Quantize the exported network and report its accuracy and size.
+
+    python export.py
+    python quantize.py --precision int8
+
+The quantized network is compared with the float32 one on self-play
+positions, taken from the replay buffer snapshot of the trainer or, without
+one, from games played by the exported network. Point `ENGINE_PATH` in
+alpha/config.py to the quantized file to play with it.
+
+This only compresses the stored weights, the NumPy engine converts them back
+to float32 at load and plays at float32 speed.
+"""
+import os
+import argparse
+import numpy as np
+
+from alpha import config as c
+from alpha.game.game import Game
+from alpha.model.engine import NumpyEngine, quantize
+from alpha.model.player import AlphaZeroPlayer
+from alpha.pipeline.replay import ReplayBuffer
+
+
+def self_play_positions(n):
+    """Get self-play positions.
+
+    # Arguments
+        n: Integer, number of positions.
+
+    # Returns
+        states: ndarray, distinct positions for network input, fewer than
+            n when the buffer is smaller.
+    """
+    buffer = ReplayBuffer()
+    if buffer.load():
+        # distinct positions, `sample` draws with replacement
+        index = np.random.permutation(len(buffer))[:n]
+        return buffer.states[index].astype(np.float32)
+
+    player = AlphaZeroPlayer(selfplay=1, engine=1)
+    game = Game(c.SIZE, c.PIECE, 1)
+    states = []
+    while sum(len(s) for s in states) < n:
+        states.append(game.self_play(player)[0])
+
+    return np.concatenate(states)[:n].astype(np.float32)
+
+
+def report(reference, engine, states):
+    """Compare an engine with the float32 one.
+
+    # Returns
+        Dict, mean policy KL divergence, value errors and best move
+            agreement.
+    """
+    value, policy = reference(states)
+    q_value, q_policy = engine(states)
+
+    eps = 1e-10
+    kl = np.sum(policy * np.log((policy + eps) / (q_policy + eps)), axis=1)
+    error = np.abs(value - q_value)
+
+    return {'policy_kl': float(kl.mean()),
+            'value_mae': float(error.mean()),
+            'value_max_error': float(error.max()),
+            'same_best_move': float(np.mean(
+                policy.argmax(axis=1) == q_policy.argmax(axis=1)))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--precision', default='int8',
+                        choices=['float16', 'int8'])
+    parser.add_argument('--positions', type=int, default=1024,
+                        help='report positions')
+    args = parser.parse_args()
+
+    out = c.ENGINE_PATH.replace('.npz', '_{0}.npz'.format(args.precision))
+    states = self_play_positions(args.positions)
+
+    quantize(c.ENGINE_PATH, out, args.precision)
+    result = report(NumpyEngine(c.ENGINE_PATH), NumpyEngine(out), states)
+
+    result['size_ratio'] = os.path.getsize(out) / \
+        os.path.getsize(c.ENGINE_PATH)
+
+    print('Quantized to {0}'.format(out))
+    for key, value in sorted(result.items()):
+        print('{0:<18}{1:.6f}'.format(key, value))
@@ -2,16 +2,24 @@
 """
 Reinforcement Learning the PolicyValue Network.
 """
+import os
 import warnings
-import numpy as np
 import pandas as pd
 import alpha.config as c
+from alpha import profiler
+from alpha.game import symmetry
 from alpha.game.game import Game
 from alpha.model.player import AlphaZeroPlayer
+from alpha.pipeline.dataset import Dataset, DatasetWriter
+from alpha.pipeline.gamepool import GamePool
+from alpha.pipeline.records import RecordWriter, read_records, to_tensors
+from alpha.pipeline.replay import ReplayBuffer
+from alpha.pipeline.trainer import StreamingTrainer
+from alpha.pipeline.workers import SelfPlayPool
 
 
 def augment_data(states, values, probs):
-    """Augment the train data.
+    """Augment the train data with the 8 symmetries of the checkerboard.
 
     # Arguments
         states: ndarray, states for network input.
@@ -23,26 +31,45 @@ def augment_data(states, values, probs):
         values: ndarray, augmented value output.
         policy: ndarray, augmented policy output.
     """
-    extends = {0: [], 1: [], 2: []}
-    for state, prob, value in zip(states[1:], probs[1:], values[1:]):
-        # rotate counterclockwise
-        for i in [1, 2, 3, 4]:
-            e_state = np.array([np.rot90(s, i) for s in state])
-            e_prob = np.rot90(prob.reshape(c.SIZE[0], c.SIZE[0]), i)
-            extends[0].append(e_state)
-            extends[1].append(value)
-            extends[2].append(e_prob.flatten())
+    states, probs, values = symmetry.augment(states, probs, values)
 
-        # flip horizontally
-        for flip in [np.fliplr, np.flipud]:
-            f_state = np.array([flip(s) for s in state])
-            f_prob = flip(prob.reshape(c.SIZE[0], c.SIZE[0]))
+    return states, values, probs
 
-            extends[0].append(f_state)
-            extends[1].append(value)
-            extends[2].append(f_prob.flatten())
 
-    return np.array(extends[0]), np.array(extends[1]), np.array(extends[2])
+def resume(buffer):
+    """Fill the replay buffer with the last snapshot or, without one, with
+    the archived game records.
+
+    # Arguments
+        buffer: ReplayBuffer, empty replay buffer.
+    """
+    if c.INIT:
+        return
+
+    if buffer.load():
+        print("Resume replay buffer with {0} samples".format(len(buffer)))
+        return
+
+    if not c.RECORD:
+        return
+
+    games = read_records()
+    # the newest games that fit in the buffer
+    kept, n = [], 0
+    for game in reversed(games):
+        n += len(game[0]) * (8 if c.AUGMENT == 1 else 1)
+        if n > buffer.capacity:
+            break
+        kept.insert(0, game)
+
+    for i in range(0, len(kept), 100):
+        states, move_probs, values = to_tensors(kept[i:i + 100])
+        if c.AUGMENT == 1:
+            states, values, move_probs = augment_data(states, values, move_probs)
+        buffer.add(states, move_probs, values)
+
+    if kept:
+        print("Resume replay buffer with {0} archived games".format(len(kept)))
 
 
 def train():
@@ -56,30 +83,165 @@ def train():
 
     player = AlphaZeroPlayer(selfplay=1, init=c.INIT)
     game = Game(c.SIZE, c.PIECE, 1)
+    writer = RecordWriter() if c.RECORD else None
+
+    buffer = ReplayBuffer()
+    resume(buffer)
+
+    pool = None
+    games = None
+    if c.SELF_PLAY_WORKERS:
+        pool = SelfPlayPool(c.SELF_PLAY_WORKERS)
+        pool.start(player.model)
+    elif c.POOL_GAMES:
+        games = GamePool(player.mcts.policy_value_fn, c.POOL_GAMES, writer)
 
     record = {"loss": [], "value_output_loss": [], "policy_output_loss": []}
     for i in range(c.SELF_PLAY_EPOCHS):
-        states, move_probs, values = game.self_play(player)
-
-        if c.AUGMENT:
+        if pool:
+            states, move_probs, values = pool.get()
+        elif games:
+            states, move_probs, values = games.next_game()
+        else:
+            with profiler.game():
+                states, move_probs, values = game.self_play(player, writer)
+
+        if c.AUGMENT == 1:
             states, values, move_probs = augment_data(states, values, move_probs)
 
-        print("Self-play turn {0}".format(i + 1))
+        if pool:
+            print("Self-play turn {0}, {1}".format(i + 1, pool.report()))
+        elif games:
+            stats = games.stats()
+            print("Self-play turn {0}, {1:.1f} positions/s, batch {2:.1f}".format(
+                i + 1, stats['positions_per_sec'], stats['batch']))
+        else:
+            print("Self-play turn {0}".format(i + 1))
+
+        buffer.add(states, move_probs, values)
+        states, values, move_probs = buffer.sample(augment=c.AUGMENT == 2)
 
         loss = player.update(states, values, move_probs)
+        if games:
+            games.invalidate()
         print("Network update >> loss:{0}, value_loss:{1}, policy_loss:{2}".format(loss[0], loss[1], loss[2]))
 
         record["loss"].append(loss[0])
         record["value_output_loss"].append(loss[1])
         record["policy_output_loss"].append(loss[2])
 
+        if pool and (i + 1) % c.WEIGHT_REFRESH == 0:
+            pool.publish(player.model)
+
         if i % 20 == 0:
             player.save_model()
+            buffer.save()
+
+    if pool:
+        pool.stop()
 
     player.save_model()
+    buffer.save()
     df = pd.DataFrame.from_dict(record)
     df.to_csv('alpha/data/loss.csv', encoding='utf-8', index=False)
 
 
+def train_streaming():
+    """
+    Train the model by steps on minibatches streamed from self-play.
+    """
+    warnings.filterwarnings("ignore")
+
+    player = AlphaZeroPlayer(selfplay=1, init=c.INIT)
+
+    buffer = ReplayBuffer()
+    resume(buffer)
+
+    pool = None
+    if c.SELF_PLAY_WORKERS:
+        pool = SelfPlayPool(c.SELF_PLAY_WORKERS)
+        pool.start(player.model)
+        games = pool.get
+    else:
+        # self-play shares the network with the training steps
+        game = Game(c.SIZE, c.PIECE, 1)
+        writer = RecordWriter() if c.RECORD else None
+        if c.POOL_GAMES:
+            game = GamePool(player.mcts.policy_value_fn, c.POOL_GAMES, writer)
+
+        def games():
+            with player.graph.as_default():
+                if c.POOL_GAMES:
+                    return game.next_game()
+                return game.self_play(player, writer)
+
+    # Keras builds the train function at the first step, it must not change
+    # the graph while the feeder runs self-play on the model
+    player.model._make_train_function()
+
+    trainer = StreamingTrainer(player, buffer, games)
+    trainer.start()
+
+    record = {"loss": [], "value_output_loss": [], "policy_output_loss": []}
+    for i in range(c.TRAIN_STEPS):
+        loss = trainer.step()
+
+        record["loss"].append(loss[0])
+        record["value_output_loss"].append(loss[1])
+        record["policy_output_loss"].append(loss[2])
+
+        if (i + 1) % c.REPORT_STEPS == 0:
+            print("Step {0} >> loss:{1}, value_loss:{2}, policy_loss:{3}, {4}".format(
+                i + 1, loss[0], loss[1], loss[2], trainer.report()))
+
+        if (i + 1) % c.PUBLISH_STEPS == 0:
+            if pool:
+                pool.publish(player.model)
+            else:
+                # self-play plays with the trained model, its cached outputs
+                # are refreshed as often as the workers get new weights
+                player.invalidate()
+                if c.POOL_GAMES:
+                    game.invalidate()
+
+        if (i + 1) % c.SAVE_STEPS == 0:
+            player.save_model()
+            trainer.save()
+
+    trainer.stop()
+    if pool:
+        pool.stop()
+
+    player.save_model()
+    buffer.save()
+    df = pd.DataFrame.from_dict(record)
+    df.to_csv('alpha/data/loss.csv', encoding='utf-8', index=False)
+
+
+def train_archive():
+    """
+    Train the model on the archived self-play games.
+    The game records are converted to the memory-mapped dataset once.
+    """
+    warnings.filterwarnings("ignore")
+
+    if not os.path.exists(c.DATASET_PATH + '_values.bin'):
+        n = DatasetWriter(c.DATASET_PATH).add_records()
+        print("Dataset of {0} positions written".format(n))
+
+    player = AlphaZeroPlayer(selfplay=1, init=c.INIT)
+    dataset = Dataset(c.DATASET_PATH)
+
+    loss = player.train_dataset(dataset, c.ARCHIVE_EPOCHS)
+    print("Network update >> loss:{0}, value_loss:{1}, policy_loss:{2}".format(loss[0], loss[1], loss[2]))
+
+    player.save_model()
+
+
 if __name__ == '__main__':
-    train()
+    if c.ARCHIVE:
+        train_archive()
+    elif c.STREAMING:
+        train_streaming()
+    else:
+        train()